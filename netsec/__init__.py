@@ -1,7 +1,33 @@
 """Place holder for package."""
 
-from netsec.analyzer import network_monitor  # noqa: F401
-from netsec.modules.models import SupportedModules  # noqa: F401
-from netsec.modules.settings import config  # noqa: F401
+from typing import Any
 
 version = "0.9.1"
+
+_LAZY = {
+    "fleet_monitor": "netsec.analyzer",
+    "multi_router_monitor": "netsec.analyzer",
+    "network_listen": "netsec.analyzer",
+    "network_monitor": "netsec.analyzer",
+    "network_serve": "netsec.analyzer",
+    "network_watch": "netsec.analyzer",
+    "SupportedModules": "netsec.modules.models",
+    "Target": "netsec.modules.models",
+    "config": "netsec.modules.settings",
+}
+
+
+def __getattr__(name: str) -> Any:
+    """Imports the public objects upon first access, to keep ``import netsec`` fast."""
+    if module := _LAZY.get(name):
+        import importlib
+
+        value = getattr(importlib.import_module(module), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__() -> list:
+    """Lists the public objects, including the ones that are yet to be imported."""
+    return sorted(set(globals()) | set(_LAZY))
@@ -1,8 +1,40 @@
-from typing import NoReturn
+import time
+from typing import Callable, FrozenSet, List, NoReturn, Tuple
 
-import gmailconnector as gc
+from netsec.modules import models, settings
 
-from netsec.modules import att, models, netgear, settings
+
+def _set_recipient() -> NoReturn:
+    """Converts the recipient into an email address object, to validate it before a scan.
+
+    Resumes the delivery of notifications that were held back by previous runs.
+    """
+    if settings.config.recipient and isinstance(settings.config.recipient, str):
+        import gmailconnector as gc
+
+        settings.config.recipient = gc.EmailAddress(address=settings.config.recipient)
+    from netsec.modules.dispatcher import get_dispatcher
+
+    get_dispatcher().resume()
+
+
+def _validate(module: models.SupportedModules) -> NoReturn:
+    """Validates the module and the environment variables required to scan it.
+
+    Args:
+        module: Module to scan.
+    """
+    _set_recipient()
+    if module == models.SupportedModules.netgear:
+        if not settings.config.router_pass:
+            raise ValueError(
+                "\n\n'router_pass' is required for NetGear routers"
+            )
+    elif module not in (models.SupportedModules.att, models.SupportedModules.arp):
+        raise ValueError(
+            "\n\nnetwork argument should be one of %s" % ", ".join("'%s'" % supported.value
+                                                                   for supported in models.SupportedModules)
+        )
 
 
 def network_monitor(module: models.SupportedModules,
@@ -11,28 +43,191 @@ def network_monitor(module: models.SupportedModules,
     """Monitor devices connected to the network.
 
     Args:
-        module: Module to scan. Currently, supports any network on a Netgear router or At&t networks.
+        module: Module to scan. Currently, supports any network on a Netgear router, At&t networks or an ARP sweep.
         init: Takes a boolean value to create a snapshot file or actually monitor the network.
         block: Takes a boolean value whether to block the intrusive device.
     """
-    if settings.config.recipient:
-        settings.config.recipient = gc.EmailAddress(address=str(settings.config.recipient))
+    _validate(module=module)
     if module == models.SupportedModules.netgear:
-        if not settings.config.router_pass:
-            raise ValueError(
-                "\n\n'router_pass' is required for NetGear routers"
-            )
+        from netsec.modules import netgear
+
         if init:
             netgear.LocalIPScan().create_snapshot()
         else:
             netgear.LocalIPScan().run(block=block)
     elif module == models.SupportedModules.att:
+        from netsec.modules import att
+
         if init:
             att.create_snapshot()
         else:
             att.run()
-    else:
+    elif module == models.SupportedModules.arp:
+        from netsec.modules import arp
+
+        if init:
+            arp.create_snapshot()
+        else:
+            arp.run()
+
+
+def multi_router_monitor(targets: List[models.Target],
+                         init: bool = True,
+                         block: bool = False,
+                         max_workers: int = None) -> NoReturn:
+    """Monitor devices connected to multiple routers, by scanning them concurrently.
+
+    Args:
+        targets: Routers to scan, as a list of Target objects.
+        init: Takes a boolean value to create a snapshot file or actually monitor the network.
+        block: Takes a boolean value whether to block the intrusive device. _only for netgear routers_
+        max_workers: Maximum number of routers to scan at once. Defaults to the number of targets.
+    """
+    from netsec.modules import scanner
+
+    _set_recipient()
+    multi_scan = scanner.MultiScan(targets=targets, max_workers=max_workers)
+    try:
+        if init:
+            multi_scan.create_snapshot()
+        else:
+            multi_scan.run(block=block)
+    finally:
+        multi_scan.shutdown()
+
+
+def network_listen(lease_files: List[str] = (),
+                   neighbors: bool = True,
+                   interval: float = 1) -> NoReturn:
+    """Monitor devices as they join the network, from DHCP leases and neighbor updates instead of polling the router.
+
+    Args:
+        lease_files: Paths of the dnsmasq or ISC DHCP lease files to watch.
+        neighbors: Watches the neighbor updates from the kernel, or the ARP table where netlink is not available.
+        interval: Number of seconds between two polls of the lease files.
+    """
+    from netsec.modules.passive import PassiveMonitor
+
+    _set_recipient()
+    monitor = PassiveMonitor(lease_files=lease_files, neighbors=neighbors, interval=interval)
+    try:
+        monitor.run()
+    finally:
+        monitor.close()
+
+
+def fleet_monitor(inventory: str,
+                  directory: str = "fleet",
+                  init: bool = False,
+                  max_workers: int = None,
+                  jitter: float = 30,
+                  interval: float = None) -> NoReturn:
+    """Monitor devices connected to the routers of many sites, using a pool of worker processes.
+
+    Args:
+        inventory: Path of the JSON file that lists the sites, with their routers and settings.
+        directory: Directory under which the state of each site is stored.
+        init: Takes a boolean value to create a snapshot file or actually monitor the network.
+        max_workers: Maximum number of sites to scan at once. Defaults to the number of CPUs.
+        jitter: Number of seconds across which the start of the scans are spread.
+        interval: Number of seconds between two rounds of scans. Scans every site once, if not set.
+    """
+    from netsec.modules.fleet import Fleet, load_sites
+
+    with Fleet(sites=load_sites(filepath=inventory), directory=directory,
+               max_workers=max_workers, jitter=jitter) as fleet:
+        if interval and not init:
+            fleet.run(interval=interval)
+        else:
+            fleet.run_once(init=init)
+
+
+def network_serve(target: models.Target = None,
+                  host: str = "127.0.0.1",
+                  port: int = 8080,
+                  interval: float = 30) -> NoReturn:
+    """Serve the latest scan, the snapshot and the block ledger as a read-only JSON API, from an in-memory cache.
+
+    Args:
+        target: Router to scan in the background. Serves the latest scan of a running monitor, if not set.
+        host: Interface to serve on.
+        port: Port to serve on.
+        interval: Number of seconds between two scans of the router.
+    """
+    from netsec.modules.api import InventoryCache, InventoryServer
+
+    InventoryServer(cache=InventoryCache(target=target, interval=interval), host=host, port=port).run()
+
+
+def _get_scanner(module: models.SupportedModules, block: bool) -> Callable[[], FrozenSet[Tuple[str, str]]]:
+    """Creates a scanner for the module, that holds the router session in memory for subsequent scans.
+
+    Args:
+        module: Module to scan.
+        block: Takes a boolean value whether to block the intrusive device.
+
+    Returns:
+        Callable:
+        Returns a callable that runs a scan and returns the IP and MAC addresses of connected devices.
+    """
+    if module == models.SupportedModules.netgear:
+        from netsec.modules import netgear
+
+        local_ip_scan = netgear.LocalIPScan()
+        return lambda: frozenset((device.ip, device.mac) for device in local_ip_scan.run(block=block))
+    if module == models.SupportedModules.arp:
+        from netsec.modules import arp
+
+        return lambda: frozenset((device.ip, device.mac) for device in arp.run())
+    from netsec.modules import att
+
+    return lambda: frozenset((device.ipv4_address, device.mac_address) for device in att.run())
+
+
+def network_watch(module: models.SupportedModules,
+                  block: bool = False,
+                  min_interval: float = 5,
+                  max_interval: float = 300,
+                  backoff: float = 2) -> NoReturn:
+    """Monitor devices connected to the network continuously, with an adaptive poll interval.
+
+    The interval resets to ``min_interval`` whenever the connected devices change, and backs off
+    by a factor of ``backoff`` upto ``max_interval`` while the network remains stable, or the router is unreachable.
+
+    Args:
+        module: Module to scan. Currently, supports any network on a Netgear router, At&t networks or an ARP sweep.
+        block: Takes a boolean value whether to block the intrusive device.
+        min_interval: Minimum number of seconds to wait between scans.
+        max_interval: Maximum number of seconds to wait between scans.
+        backoff: Factor by which the interval is increased when there are no changes.
+    """
+    if not 0 < min_interval <= max_interval:
+        raise ValueError(
+            "\n\n'min_interval' should be a positive number, not exceeding 'max_interval'"
+        )
+    if backoff < 1:
         raise ValueError(
-            "\n\nnetwork argument should either be '%s' or '%s'" % (models.SupportedModules.att,
-                                                                    models.SupportedModules.netgear)
+            "\n\n'backoff' should be greater than or equal to 1"
         )
+    _validate(module=module)
+    scanner = _get_scanner(module=module, block=block)
+    previous, interval = None, min_interval
+    while True:
+        try:
+            current = scanner()
+        except ConnectionError as error:
+            settings.LOGGER.error(error)
+            interval = min(interval * backoff, max_interval)
+            settings.LOGGER.debug("Next scan in %.1f seconds." % interval)
+            time.sleep(interval)
+            continue
+        if previous is None:
+            interval = min_interval
+        elif current != previous:
+            settings.LOGGER.info("Change in connected devices detected.")
+            interval = min_interval
+        else:
+            interval = min(interval * backoff, max_interval)
+        previous = current
+        settings.LOGGER.debug("Next scan in %.1f seconds." % interval)
+        time.sleep(interval)
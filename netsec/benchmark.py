@@ -0,0 +1,728 @@
+"""Benchmarks for NetSec's hot paths, runnable with ``python -m netsec.benchmark``."""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Generator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from unittest import mock
+
+from netsec.modules import att
+from netsec.modules.settings import LOGGER, config
+
+
+def synthetic_devices(count: int, seed: int = 0, start: int = 0) -> List[Tuple[str, str, str, int]]:
+    """Generates devices with random MAC addresses and sequential IP addresses.
+
+    Args:
+        count: Number of devices to generate.
+        seed: Seed for the random generator, to produce reproducible devices.
+        start: Index of the first device, which determines its IP address and name.
+
+    Returns:
+        List[Tuple[str, str, str, int]]:
+        Returns the MAC address, IP address, name and connection speed of each device.
+    """
+    rand = random.Random(seed)
+    devices = []
+    for index in range(start, start + count):
+        mac = ":".join("%02x" % rand.randrange(256) for _ in range(6))
+        ip = "10.%d.%d.%d" % (index >> 16 & 255, index >> 8 & 255, index & 255)
+        devices.append((mac, ip, "device-%d" % index, rand.randrange(1, 1_200)))
+    return devices
+
+
+def _render_page(devices: List[Tuple[str, str, str, int]]) -> str:
+    """Renders the devices as a ``devices.ha`` page."""
+    rows = []
+    for mac, ip, name, speed in devices:
+        rows.append(
+            "<tr><th>MAC Address</th><td>%s</td></tr>"
+            "<tr><th>IPv4 Address / Name</th><td>%s / %s</td></tr>"
+            "<tr><th>Last Activity</th><td>Mon Jan 2 15:04:05 2023</td></tr>"
+            "<tr><th>Status</th><td>on</td></tr>"
+            "<tr><th>Allocation</th><td>dhcp</td></tr>"
+            "<tr><th>Connection Type</th><td>Wi-Fi: 5 GHz</td></tr>"
+            "<tr><th>Connection Speed</th><td>%d Mbps</td></tr>"
+            "<tr><th>Mesh Client</th><td>No</td></tr>"
+            "<tr><td colspan=\"2\"><hr></td></tr>" % (mac, ip, name, speed)
+        )
+    return "<html><body><table>%s</table></body></html>" % "".join(rows)
+
+
+def synthetic_page(count: int, seed: int = 0) -> str:
+    """Generates a ``devices.ha`` page with the given number of devices.
+
+    Args:
+        count: Number of devices to include in the page.
+        seed: Seed for the random generator, to produce reproducible pages.
+
+    Returns:
+        str:
+        Returns the HTML source of the page.
+    """
+    return _render_page(devices=synthetic_devices(count=count, seed=seed))
+
+
+def _chunks(text: str, size: int = 8_192) -> Generator[str]:
+    """Splits the text into chunks, to mimic a streamed response body."""
+    for index in range(0, len(text), size):
+        yield text[index:index + size]
+
+
+def _parse_stream(page: str) -> List[att.Device]:
+    """Parses the page using the incremental parser."""
+    return list(att.DevicesParser().parse(_chunks(page)))
+
+
+def _parse_pandas(page: str) -> List[att.Device]:
+    """Parses the page using the ``pd.read_html`` based approach, that was used prior to the incremental parser."""
+    import io
+
+    import pandas as pd
+
+    devices, device_info = [], {}
+    for value in pd.read_html(io.StringIO(page))[0].values:
+        if str(value[0]) == "nan":
+            devices.append(att.Device(device_info))
+            device_info = {}
+        elif value[0] == "IPv4 Address / Name":
+            key = value[0].split('/')
+            val = value[1].split('/')
+            device_info[att.format_key(key[0].strip())] = val[0].strip()
+            device_info[att.format_key(key[1].strip())] = val[1].strip()
+        else:
+            device_info[att.format_key(value[0])] = value[1]
+    return devices
+
+
+def _measure(function: Callable, *args, repeat: int = 3) -> float:
+    """Returns the best wall-clock time in seconds, across the given number of runs."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def parser_benchmark(counts: Sequence[int] = (10, 100, 1_000, 5_000), repeat: int = 3) -> List[Dict[str, float]]:
+    """Compares the incremental parser against the pandas parser, for pages with varying number of devices.
+
+    Args:
+        counts: Number of devices in each page.
+        repeat: Number of runs per page, the fastest of which is reported.
+
+    Returns:
+        List[Dict[str, float]]:
+        Returns the timings in seconds per page. Pandas timings are ``None`` when pandas is not installed.
+    """
+    try:
+        import pandas  # noqa: F401
+    except ImportError:
+        has_pandas = False
+    else:
+        has_pandas = True
+    results = []
+    for count in counts:
+        page = synthetic_page(count=count)
+        results.append(dict(
+            devices=count,
+            stream=_measure(_parse_stream, page, repeat=repeat),
+            pandas=_measure(_parse_pandas, page, repeat=repeat) if has_pandas else None
+        ))
+    return results
+
+
+HEAVY_MODULES = ("pandas", "lxml", "requests", "pynetgear", "gmailconnector", "jinja2", "yaml")
+
+
+def import_benchmark(statement: str = "import netsec", budget_ms: float = 50) -> Dict[str, Any]:
+    """Measures the import time of a statement in a fresh interpreter, using ``python -X importtime``.
+
+    Args:
+        statement: Import statement to measure.
+        budget_ms: Maximum cumulative import time for the ``netsec`` modules in milliseconds.
+
+    Returns:
+        Dict[str, Any]:
+        Returns the import time in milliseconds, the heavy dependencies that were imported and whether
+        the import stayed within budget without loading any heavy dependencies.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            capture_output=True, text=True, env=env)
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    imported, cumulative = set(), 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, name = line.split("|")
+        if not total.strip().isdigit():
+            continue  # header
+        imported.add(name.strip())
+        if name[1:2] != " " and name.strip().startswith("netsec"):  # top level imports of the package
+            cumulative += int(total)
+    heavy = sorted(module for module in HEAVY_MODULES if module in imported)
+    return dict(statement=statement, milliseconds=cumulative / 1_000, heavy=heavy,
+                ok=not heavy and cumulative / 1_000 <= budget_ms)
+
+
+class _DevicesHandler(BaseHTTPRequestHandler):
+    """Serves the page held by the server, after the server's latency."""
+
+    def do_GET(self) -> None:
+        """Responds with the current page, an injected server error, or ``304`` if the client has the current page."""
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            if failure := self.server.failures and self.server.failures.pop(0):
+                self.send_error(failure)
+                return
+            page, etag = self.server.page, self.server.etag
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(page)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", self.date_time_string(self.server.modified))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, *args) -> None:
+        """Suppresses the access logs."""
+
+
+class MockDevicesServer:
+    """Local stand-in for the ``devices.ha`` page of an At&t router.
+
+    >>> MockDevicesServer
+
+    See Also:
+        - With ``etag`` enabled, the page is served with ``ETag`` and ``Last-Modified`` headers,
+          and conditional requests for the current page are answered with ``304 Not Modified``
+        - Server errors can be injected with ``fail``, to be returned by the requests that follow.
+    """
+
+    def __init__(self, latency: float = 0, etag: bool = False):
+        """Binds an HTTP server to a free port on the loopback interface.
+
+        Args:
+            latency: Number of seconds to wait before responding to each request.
+            etag: Serves the page with validators, and answers conditional requests.
+        """
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _DevicesHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.lock = threading.Lock()
+        self.httpd.page = b""
+        self.httpd.etag = None
+        self.httpd.modified = time.time()
+        self.httpd.failures = []
+        self.httpd.requests = self.httpd.not_modified = 0
+        self.validators = etag
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def source(self) -> str:
+        """URL of the devices page."""
+        return "http://127.0.0.1:%d/cgi-bin/devices.ha" % self.httpd.server_port
+
+    def serve(self, devices: List[Tuple[str, str, str, int]], etag: str = None) -> None:
+        """Renders the devices as the page served for the following requests.
+
+        Args:
+            devices: Devices to list in the page.
+            etag: Entity tag of the page. Defaults to a digest of the page, when validators are enabled.
+        """
+        page = _render_page(devices=devices).encode()
+        with self.httpd.lock:
+            self.httpd.page = page
+            if self.validators:
+                self.httpd.etag = '"%s"' % (etag or hashlib.sha1(page).hexdigest()[:16])
+                self.httpd.modified = time.time()
+
+    def fail(self, *statuses: int) -> None:
+        """Responds to the following requests with the server errors, in order."""
+        with self.httpd.lock:
+            self.httpd.failures.extend(statuses)
+
+    @property
+    def requests(self) -> int:
+        """Number of requests received."""
+        return self.httpd.requests
+
+    @property
+    def not_modified(self) -> int:
+        """Number of requests answered with a 304."""
+        return self.httpd.not_modified
+
+    def __enter__(self) -> "MockDevicesServer":
+        """Starts serving requests in the background."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="netsec-benchmark", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        """Stops the server."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeNetgear:
+    """Stand-in for ``pynetgear.Netgear``, that lists synthetic devices and accepts allow or block calls.
+
+    >>> FakeNetgear
+
+    """
+
+    def __init__(self, latency: float = 0):
+        """Instantiates the router without any devices.
+
+        Args:
+            latency: Number of seconds each call to the router takes.
+        """
+        from pynetgear import Device
+
+        self._device = Device
+        self.latency = latency
+        self.devices = []
+
+    def serve(self, devices: List[Tuple[str, str, str, int]]) -> None:
+        """Sets the devices listed by the following calls."""
+        template = dict.fromkeys(self._device._fields)
+        self.devices = [self._device(**dict(template, mac=mac, ip=ip, name=name, type="wireless", signal=100,
+                                            link_rate=speed, allow_or_block="Allow"))
+                        for mac, ip, name, speed in devices]
+
+    def get_attached_devices(self) -> list:
+        """Lists the devices."""
+        time.sleep(self.latency)
+        return self.devices
+
+    get_attached_devices_2 = get_attached_devices
+
+    def config_start(self) -> bool:
+        """Starts a configuration session."""
+        time.sleep(self.latency)
+        return True
+
+    def config_finish(self) -> bool:
+        """Finishes a configuration session."""
+        time.sleep(self.latency)
+        return True
+
+    def _make_request(self, *args, **kwargs) -> Tuple[bool, None]:
+        """Accepts any request."""
+        time.sleep(self.latency)
+        return True, None
+
+
+_PATHS = ("snapshot", "snapshot_journal", "blocked", "blocked_yaml", "notification", "notification_queue",
+          "alert_state", "last_scan", "history", "oui_index", "telemetry")
+
+
+@contextlib.contextmanager
+def _workspace() -> Generator[str]:
+    """Points the state files to a temporary directory, with notifications disabled and logging reduced to errors."""
+    saved, level = dict(vars(config)), LOGGER.level
+    with tempfile.TemporaryDirectory(prefix="netsec-benchmark-") as directory:
+        for name in _PATHS:
+            setattr(config, name, os.path.join(directory, os.path.basename(getattr(type(config), name))))
+        config.router_pass = "benchmark"
+        config.gmail_user = config.gmail_pass = config.recipient = config.phone = None
+        LOGGER.setLevel(logging.ERROR)
+        try:
+            yield directory
+        finally:
+            LOGGER.setLevel(level)
+            vars(config).clear()
+            vars(config).update(saved)
+
+
+def _timed(function: Callable, *args, **kwargs) -> float:
+    """Returns the wall-clock time in seconds, for a single run."""
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def scan_benchmark(counts: Sequence[int] = (10, 100, 1_000, 10_000, 50_000),
+                   latency: float = 0, repeat: int = 3) -> List[Dict[str, float]]:
+    """Measures the stages of a scan end-to-end, against a mock At&t router and a fake Netgear router.
+
+    Every scan sees 1% of the devices (atleast one) as new, so that the alerting path is exercised.
+
+    Args:
+        counts: Number of devices connected to the routers.
+        latency: Number of seconds each call to the routers takes.
+        repeat: Number of scans per count, the fastest of which is reported.
+
+    Returns:
+        List[Dict[str, float]]:
+        Returns the timings in seconds per count, for the scans and each of their stages.
+    """
+    from netsec.analyzer import network_monitor
+    from netsec.modules import netgear
+    from netsec.modules.dispatcher import get_template
+    from netsec.modules.inventory import Inventory
+    from netsec.modules.models import SupportedModules
+    from netsec.modules.snapshot import Snapshot
+
+    results = []
+    for count in counts:
+        known = synthetic_devices(count=count)
+        scans = [known + synthetic_devices(count=max(count // 100, 1), seed=run + 1, start=count)
+                 for run in range(repeat)]
+        router = FakeNetgear(latency=latency)
+        with _workspace() as directory, MockDevicesServer(latency=latency) as server, \
+                mock.patch.object(att, "get_source", return_value=server.source), \
+                mock.patch.object(netgear, "Netgear", return_value=router):
+            result = dict(devices=count)
+            for module, backend in ((SupportedModules.att, server), (SupportedModules.netgear, router)):
+                backend.serve(devices=known)
+                result["%s_snapshot" % module.name] = _timed(network_monitor, module=module, init=True)
+                timings = []
+                for devices in scans:
+                    backend.serve(devices=devices)
+                    timings.append(_timed(network_monitor, module=module, init=False))
+                result["%s_scan" % module.name] = min(timings)
+            page = _render_page(devices=scans[0])
+            result["parse"] = _measure(_parse_stream, page, repeat=repeat)
+            records = Inventory(att.to_record(device) for device in _parse_stream(page))
+            store = Snapshot(filepath=os.path.join(directory, "bench.json"),
+                             journal=os.path.join(directory, "bench.journal"))
+            result["snapshot_save"] = _measure(store.save, records, repeat=repeat)
+            result["snapshot_load"] = _measure(lambda: Snapshot(filepath=store.filepath,
+                                                                journal=store.journal).inventory(), repeat=repeat)
+            alerts = [dict(Name=name, IP=ip, MAC=mac) for mac, ip, name, _ in scans[0][count:]]
+            get_template()
+            result["notify_render"] = _measure(lambda: get_template().render(alerts=alerts), repeat=repeat)
+        results.append(result)
+    return results
+
+
+def client_checks(count: int = 500) -> Dict[str, Any]:
+    """Checks the pooled client for the At&t devices page, against the mock router with validators and failures.
+
+    Args:
+        count: Number of devices in the page.
+
+    Returns:
+        Dict[str, Any]:
+        Returns the outcome of each check, and whether all of them passed.
+    """
+    devices = synthetic_devices(count=count)
+    with _workspace(), MockDevicesServer(etag=True) as server:
+        client = att.DevicesClient(source=server.source, retries=2, backoff=0, chunk_size=256)
+        server.serve(devices=devices)
+        first = client.get_attached_devices()
+        checks = dict(streamed=[device.mac_address for device in first] == [mac for mac, *_ in devices])
+
+        requests = server.requests
+        checks['not_modified'] = client.get_attached_devices() is first and server.not_modified == 1
+        checks['single_request'] = server.requests == requests + 1
+
+        server.serve(devices=devices, etag="rotated")  # same page with a new validator, so the digest matches
+        with mock.patch.object(att.DevicesParser, "parse") as parse:
+            checks['digest_unchanged'] = (client.get_attached_devices() is first and server.not_modified == 1
+                                          and not parse.called)
+
+        server.serve(devices=devices[1:])
+        checks['changed'] = len(client.get_attached_devices()) == count - 1
+
+        server.serve(devices=devices)
+        requests = server.requests
+        server.fail(503, 502)
+        checks['retried'] = len(client.get_attached_devices()) == count and server.requests == requests + 3
+
+        server.fail(503, 503, 503)
+        with mock.patch.object(LOGGER, "error"):
+            try:
+                client.get_attached_devices()
+            except ConnectionError:
+                checks['gave_up'] = server.requests == requests + 6
+            else:
+                checks['gave_up'] = False
+        client.close()
+    return dict(checks, ok=all(checks.values()))
+
+
+_DNSMASQ_LEASES = """\
+1760000000 aa:bb:cc:00:00:01 192.168.1.10 laptop 01:aa:bb:cc:00:00:01
+1760000100 aa:bb:cc:00:00:02 192.168.1.11 * *
+malformed line
+"""
+
+_ISC_LEASES = """\
+lease 192.168.1.20 {
+  starts 4 2026/10/01 10:00:00;
+  binding state active;
+  hardware ethernet aa:bb:cc:00:00:03;
+  client-hostname "phone";
+}
+lease 192.168.1.21 {
+  binding state active;
+  hardware ethernet aa:bb:cc:00:00:04;
+}
+lease 192.168.1.22 {
+  binding state active;
+  hardware ethernet aa:bb:cc:00:00:04;
+}
+lease 192.168.1.23 {
+  binding state active;
+  hardware ethernet aa:bb:cc:00:00:05;
+}
+lease 192.168.1.23 {
+  binding state free;
+  hardware ethernet aa:bb:cc:00:00:05;
+}
+lease 192.168.1.24 {
+  binding state active;
+}
+"""
+
+_ARP_TABLE = """\
+IP address       HW type     Flags       HW address            Mask     Device
+192.168.1.30     0x1         0x2         aa:bb:cc:00:00:06     *        eth0
+192.168.1.31     0x1         0x0         00:00:00:00:00:00     *        eth0
+"""
+
+
+def _neighbor_message(ip: str, mac: bytes, family: int = 2, state: int = 0x02, kind: int = 28) -> bytes:
+    """Builds a netlink message for a neighbor update, with the destination and link layer address attributes."""
+    attributes = b""
+    for attribute, value in ((1, socket.inet_aton(ip)), (2, mac)):
+        size = 4 + len(value)
+        attributes += struct.pack("=HH", size, attribute) + value + b"\0" * (-size % 4)
+    body = struct.pack("=BBHiHBB", family, 0, 0, 2, state, 0, 1) + attributes
+    return struct.pack("=IHHII", 16 + len(body), kind, 0, 0, 0) + body
+
+
+def passive_checks() -> Dict[str, Any]:
+    """Checks the parsers and watchers of the passive mode, against lease files, ARP tables and netlink fixtures.
+
+    Returns:
+        Dict[str, Any]:
+        Returns the outcome of each check, and whether all of them passed.
+    """
+    from netsec.modules.passive import (FileWatcher, NeighborListener,
+                                        parse_leases)
+
+    checks = {}
+    leases = parse_leases(text=_DNSMASQ_LEASES)
+    checks['dnsmasq'] = ({mac: (lease.ip, lease.name) for mac, lease in leases.items()} ==
+                         {"AA:BB:CC:00:00:01": ("192.168.1.10", "laptop"), "AA:BB:CC:00:00:02": ("192.168.1.11", None)})
+    leases = parse_leases(text=_ISC_LEASES)
+    checks['isc'] = ({mac: (lease.ip, lease.name) for mac, lease in leases.items()} ==
+                     {"AA:BB:CC:00:00:03": ("192.168.1.20", "phone"), "AA:BB:CC:00:00:04": ("192.168.1.22", None)})
+
+    with tempfile.TemporaryDirectory(prefix="netsec-passive-") as directory:
+        filepath = os.path.join(directory, "dnsmasq.leases")
+        watcher = FileWatcher(filepath=filepath)
+        checks['missing_file'] = watcher.poll() == []
+        with open(filepath, 'w') as file:
+            file.write(_DNSMASQ_LEASES)
+        checks['new_leases'] = sorted(observation.mac for observation in watcher.poll()) == [
+            "AA:BB:CC:00:00:01", "AA:BB:CC:00:00:02"
+        ]
+        checks['unchanged_file'] = watcher.poll() == []
+        with open(filepath, 'w') as file:
+            file.write(_DNSMASQ_LEASES.replace("192.168.1.11", "192.168.1.12"))
+        os.utime(filepath, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+        changed = watcher.poll()
+        checks['changed_lease'] = [(observation.mac, observation.ip) for observation in changed] == [
+            ("AA:BB:CC:00:00:02", "192.168.1.12")
+        ]
+
+        filepath = os.path.join(directory, "arp")
+        with open(filepath, 'w') as file:
+            file.write(_ARP_TABLE)
+        watcher = FileWatcher(filepath=filepath, arp=True)
+        checks['arp_table'] = [(observation.mac, observation.ip) for observation in watcher.poll()] == [
+            ("AA:BB:CC:00:00:06", "192.168.1.30")
+        ]
+        checks['unchanged_arp_table'] = watcher.poll() == []
+
+    datagram = (_neighbor_message(ip="192.168.1.40", mac=bytes.fromhex("aabbcc000007")) +
+                _neighbor_message(ip="192.168.1.41", mac=bytes.fromhex("aabbcc000008"), state=0x20) +  # failed
+                _neighbor_message(ip="192.168.1.42", mac=bytes.fromhex("aabbcc000009"), family=10) +
+                _neighbor_message(ip="192.168.1.43", mac=bytes.fromhex("aabbcc00000a"), kind=29))  # deleted
+    checks['netlink'] = [(observation.mac, observation.ip) for observation in NeighborListener.parse(datagram)] == [
+        ("AA:BB:CC:00:00:07", "192.168.1.40")
+    ]
+    return dict(checks, ok=all(checks.values()))
+
+
+def _stress_worker(directory: str, worker: int, operations: int) -> int:
+    """Adds devices to a shared snapshot, reading it back in between, and returns the number of failed reads."""
+    from netsec.modules.inventory import Record
+    from netsec.modules.snapshot import Snapshot
+
+    store = Snapshot(filepath=os.path.join(directory, "snapshot.json"),
+                     journal=os.path.join(directory, "snapshot.journal"), compact_after=25)
+    failures = 0
+    for operation in range(operations):
+        store.put(record=Record(mac="02:00:00:%02x:%02x:%02x" % (worker, operation >> 8, operation & 255),
+                                ip="10.%d.%d.%d" % (worker, operation >> 8, operation & 255)))
+        if operation % 10 == 0:
+            try:
+                if len(Snapshot(filepath=store.filepath, journal=store.journal).inventory()) < operation + 1:
+                    failures += 1
+            except ValueError:  # partially written snapshot
+                failures += 1
+    return failures
+
+
+def state_stress(processes: int = 8, operations: int = 200) -> Dict[str, Any]:
+    """Adds devices to one snapshot from multiple processes at once, while they compact it and read it back.
+
+    Args:
+        processes: Number of processes writing to the snapshot.
+        operations: Number of devices added by each process.
+
+    Returns:
+        Dict[str, Any]:
+        Returns the number of devices expected and found, the number of failed reads and whether none were lost.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    from netsec.modules.snapshot import Snapshot
+
+    with tempfile.TemporaryDirectory(prefix="netsec-stress-") as directory:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            failures = sum(executor.map(_stress_worker, [directory] * processes, range(processes),
+                                        [operations] * processes))
+        seconds = time.perf_counter() - start
+        found = len(Snapshot(filepath=os.path.join(directory, "snapshot.json"),
+                             journal=os.path.join(directory, "snapshot.journal")).inventory())
+    expected = processes * operations
+    return dict(processes=processes, operations=operations, seconds=seconds, expected=expected, found=found,
+                failed_reads=failures, ok=found == expected and not failures)
+
+
+def vendor_benchmark(prefixes: int = 40_000, lookups: int = 100_000, seed: int = 0) -> Dict[str, float]:
+    """Measures the OUI vendor index, over a synthetic registry about the size of the IEEE's.
+
+    Args:
+        prefixes: Number of MA-L prefixes in the registry.
+        lookups: Number of random MAC addresses to look up.
+        seed: Seed for the random generator, so that runs are comparable.
+
+    Returns:
+        Dict[str, float]:
+        Returns the time to build the index in seconds, and the time to open it and to look up a MAC in microseconds.
+    """
+    from netsec.modules.oui import VendorIndex, build
+
+    generator = random.Random(seed)
+    assignments = generator.sample(range(1 << 24), prefixes)
+    macs = ["%06X%06X" % (generator.choice(assignments), generator.getrandbits(24)) for _ in range(lookups)]
+    with tempfile.TemporaryDirectory(prefix="netsec-oui-") as directory:
+        source, output = os.path.join(directory, "oui.csv"), os.path.join(directory, "oui.idx")
+        with open(source, 'w') as file:
+            file.write("Registry,Assignment,Organization Name,Organization Address\n")
+            file.writelines("MA-L,%06X,Vendor %d,Address\n" % (assignment, assignment % 5_000)
+                            for assignment in assignments)
+        seconds = _timed(build, sources=[source], output=output)
+        index = VendorIndex(filepath=output)
+        opened = _timed(len, index)
+        start = time.perf_counter()
+        found = sum(1 for mac in macs if index.lookup(mac))
+        lookup = time.perf_counter() - start
+        size = os.path.getsize(output)
+        index.close()
+    return dict(prefixes=prefixes, size_bytes=size, build=seconds, open_us=opened * 1e6,
+                lookup_us=lookup / lookups * 1e6, ok=found == lookups)
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> List[str]:
+    """Compares the timings in a report against a previous report.
+
+    Args:
+        report: Report from the current run.
+        baseline: Report from a previous run.
+        tolerance: Fraction by which a timing may exceed the baseline.
+
+    Returns:
+        List[str]:
+        Returns a description of each timing that regressed beyond the tolerance.
+    """
+    regressions = []
+    for section in ("parser", "scans"):
+        previous = {entry["devices"]: entry for entry in baseline.get(section) or ()}
+        for entry in report.get(section) or ():
+            if not (before := previous.get(entry["devices"])):
+                continue
+            for key, value in entry.items():
+                if key == "devices" or not isinstance(value, float) or not isinstance(before.get(key), float):
+                    continue
+                if value > before[key] * (1 + tolerance):
+                    regressions.append("%s[%d].%s: %.4fs -> %.4fs" % (section, entry["devices"], key,
+                                                                      before[key], value))
+    return regressions
+
+
+def _arguments() -> argparse.Namespace:
+    """Parses the command line arguments."""
+    parser = argparse.ArgumentParser(prog="python -m netsec.benchmark", description=__doc__)
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1_000, 10_000, 50_000],
+                        help="Number of devices to scan.")
+    parser.add_argument("--latency", type=float, default=0, help="Latency of the mock routers in seconds.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the fastest of which is reported.")
+    parser.add_argument("--output", help="Writes the report to a file, in addition to stdout.")
+    parser.add_argument("--baseline", help="Previous report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Fraction by which a timing may exceed the baseline.")
+    parser.add_argument("--stress", type=int, default=0, metavar="PROCESSES",
+                        help="Writes to one snapshot from many processes, and fails if any update is lost.")
+    parser.add_argument("--checks", action="store_true",
+                        help="Checks the clients against the mock routers, and fails if any check does.")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _arguments()
+    report = dict(imports=import_benchmark(),
+                  parser=parser_benchmark(counts=[count for count in args.counts if count <= 5_000],
+                                          repeat=args.repeat),
+                  scans=scan_benchmark(counts=args.counts, latency=args.latency, repeat=args.repeat),
+                  vendors=vendor_benchmark())
+    if args.stress:
+        report['state'] = state_stress(processes=args.stress)
+    if args.checks:
+        report['checks'] = dict(client=client_checks(), passive=passive_checks())
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if not report['imports']['ok']:
+        sys.exit("'import netsec' exceeded the budget, or loaded %s" % report['imports']['heavy'])
+    if args.stress and not report['state']['ok']:
+        sys.exit("Concurrent updates to the snapshot were lost: %s" % report['state'])
+    if args.checks and (failed := [name for name, result in report['checks'].items() if not result['ok']]):
+        sys.exit("Checks failed: %s" % {name: report['checks'][name] for name in failed})
+    if args.baseline:
+        with open(args.baseline) as file:
+            if regressions := compare(report=report, baseline=json.load(file), tolerance=args.tolerance):
+                sys.exit("Regressions beyond %d%%:\n%s" % (args.tolerance * 100, "\n".join(regressions)))
@@ -0,0 +1,114 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, NoReturn, Optional, Tuple
+
+from netsec.modules.settings import LOGGER, config
+from netsec.modules.state import atomic_write
+
+
+class AlertState:
+    """Tracks the alerts sent per device, so that only new or changed threats are notified.
+
+    >>> AlertState
+
+    See Also:
+        - Alerts are keyed by MAC address, along with a fingerprint of the name and IP address.
+        - A device is alerted again only when its fingerprint changes, or after ``ttl`` seconds.
+        - Holds at most ``max_size`` devices, evicting the least recently alerted ones.
+    """
+
+    def __init__(self, ttl: float = 3_600, max_size: int = 10_000, filepath: str = None):
+        """Loads the alert state from disk.
+
+        Args:
+            ttl: Number of seconds after which an unchanged threat is alerted again.
+            max_size: Maximum number of devices to track.
+            filepath: Path of the state file. Defaults to ``config.alert_state``
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.filepath = filepath or config.alert_state
+        self._entries: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+        self._dirty = False
+        if os.path.isfile(self.filepath):
+            with open(self.filepath) as file:
+                try:
+                    entries = json.load(file)
+                except ValueError as error:
+                    LOGGER.error("Failed to load %s: %s" % (self.filepath, error))
+                    entries = {}
+            for key, (fingerprint, alerted) in sorted(entries.items(), key=lambda item: item[1][1]):
+                self._entries[key] = (fingerprint, alerted)
+
+    @staticmethod
+    def _key(threat: Dict[str, str]) -> Tuple[Optional[str], str]:
+        """Returns the key and the fingerprint of a threat."""
+        mac = threat.get('MAC')
+        key = mac.upper() if mac else threat.get('IP')
+        return key, "%s|%s" % (threat.get('Name'), threat.get('IP'))
+
+    def should_alert(self, threat: Dict[str, str], now: float = None) -> bool:
+        """Checks if a threat has to be notified, and records it as alerted if so.
+
+        Args:
+            threat: Threat information with ``Name``, ``IP`` and ``MAC`` keys.
+            now: Current time. Defaults to ``time.time()``
+
+        Returns:
+            bool:
+            Returns a boolean flag to indicate whether the threat is new, changed or past its ttl.
+        """
+        key, fingerprint = self._key(threat=threat)
+        now = now or time.time()
+        if (entry := self._entries.get(key)) and entry[0] == fingerprint and now - entry[1] < self.ttl:
+            return False
+        self._entries[key] = (fingerprint, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._dirty = True
+        return True
+
+    def filter(self, threats: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Filters the threats that have to be notified, and saves the state if it changed.
+
+        Args:
+            threats: List of threats found in a scan.
+
+        Returns:
+            List[Dict[str, str]]:
+            Returns the threats that are new, changed or past their ttl.
+        """
+        now = time.time()
+        alerts = [threat for threat in threats if self.should_alert(threat=threat, now=now)]
+        self.save()
+        return alerts
+
+    def forget(self, mac: str) -> NoReturn:
+        """Removes a device from the alert state, so that it is alerted again when seen.
+
+        Args:
+            mac: MAC address of the device.
+        """
+        if self._entries.pop(mac.upper(), None):
+            self._dirty = True
+            self.save()
+
+    def save(self) -> NoReturn:
+        """Writes the alert state to disk, if it has changed."""
+        if not self._dirty:
+            return
+        atomic_write(filepath=self.filepath, data=json.dumps(self._entries))
+        self._dirty = False
+
+
+_STATES: Dict[str, AlertState] = {}
+
+
+def get_alert_state() -> AlertState:
+    """Returns the alert state for the current ``config.alert_state``, which is retained across scans."""
+    if config.alert_state not in _STATES:
+        _STATES[config.alert_state] = AlertState()
+    return _STATES[config.alert_state]
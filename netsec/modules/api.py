@@ -0,0 +1,401 @@
+import asyncio
+import base64
+import bisect
+import hashlib
+import json
+import time
+from typing import Any, Callable, Dict, List, NoReturn, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from netsec.modules.events import Tracker
+from netsec.modules.inventory import Record
+from netsec.modules.metrics import get_metrics
+from netsec.modules.models import Target
+from netsec.modules.settings import LOGGER, config
+from netsec.modules.state import file_stamp
+
+LIMIT = 100
+MAX_LIMIT = 1_000
+_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 503: "Service Unavailable"}
+
+
+def _item(record: Record) -> Dict[str, Any]:
+    """Converts a Record object into a JSON serializable dictionary."""
+    return dict(mac=record.mac, ip=record.ip, name=record.name, type=record.type, status=record.status,
+                vendor=record.vendor, randomized=record.randomized)
+
+
+def _key(item: Dict[str, Any]) -> str:
+    """Returns the key that the items are sorted and paginated by."""
+    return item.get("mac") or item.get("ip") or ""
+
+
+def _encode(key: str) -> str:
+    """Encodes the key of the last item in a page, as an opaque cursor."""
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> str:
+    """Decodes a cursor into the key of the last item in the previous page. Raises ``ValueError`` if invalid."""
+    return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode()
+
+
+class View:
+    """Immutable list of items served for a resource, sorted by MAC address (or IP address when there isn't one).
+
+    >>> View
+
+    See Also:
+        - Pages start after the key of the last item in the previous page, so a cursor remains valid across updates.
+        - The ``etag`` is a digest of the contents, so it only changes when the items do.
+    """
+
+    __slots__ = ("items", "keys", "etag", "updated", "_by_mac", "_by_ip")
+
+    def __init__(self, items: List[Dict[str, Any]], updated: float = None):
+        """Sorts and indexes the items.
+
+        Args:
+            items: Items of the resource, with ``mac`` and/or ``ip`` keys.
+            updated: Time when the items were last updated. Defaults to current time.
+        """
+        self.items = sorted(items, key=_key)
+        self.keys = [_key(item) for item in self.items]
+        self.etag = hashlib.sha1(json.dumps(self.items, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        self.updated = updated or time.time()
+        self._by_mac = {item["mac"]: index for index, item in enumerate(self.items) if item.get("mac")}
+        self._by_ip = {item["ip"]: index for index, item in enumerate(self.items) if item.get("ip")}
+
+    def page(self, mac: str = None, ip: str = None, status: str = None,
+             cursor: str = None, limit: int = LIMIT) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Filters the items, and returns a page of them.
+
+        Args:
+            mac: MAC address of the device.
+            ip: IP address of the device.
+            status: Status of the device, compared case-insensitively.
+            cursor: Cursor returned with the previous page.
+            limit: Maximum number of items in the page.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], Optional[str]]:
+            Returns the items in the page, and the cursor for the next page if there are more items.
+        """
+        if mac or ip:  # atmost one device matches, so the index replaces the scan
+            index = self._by_mac.get(mac.upper()) if mac else self._by_ip.get(ip)
+            candidates = [self.items[index]] if index is not None else []
+            candidates = [item for item in candidates if not ip or item.get("ip") == ip]
+            start = 0
+        else:
+            candidates = self.items
+            start = bisect.bisect_right(self.keys, _decode(cursor)) if cursor else 0
+        status = status.casefold() if status else None
+        items = []
+        for index in range(start, len(candidates)):
+            if status and str(candidates[index].get("status")).casefold() != status:
+                continue
+            if len(items) == limit:
+                return items, _encode(_key(items[-1]))
+            items.append(candidates[index])
+        return items, None
+
+
+class InventoryCache:
+    """Holds the latest scan, the snapshot and the block ledger in memory, for the API to serve.
+
+    >>> InventoryCache
+
+    See Also:
+        - Without a target, the latest scan is read from ``config.last_scan`` as written by a running monitor,
+          so that the API never contacts the router.
+        - With a target, the router is scanned every ``interval`` seconds in the background. Reads never trigger a
+          scan, so any number of clients cause atmost one scan per interval.
+        - The snapshot and the ledger are re-read only when their files change.
+    """
+
+    def __init__(self, target: Target = None, interval: float = 30):
+        """Instantiates the cache, without reading anything.
+
+        Args:
+            target: Router to scan. Defaults to reading the latest scan of a running monitor.
+            interval: Number of seconds between two scans of the router.
+        """
+        self.target = target
+        self.interval = interval
+        self.scans = 0
+        self._views: Dict[str, View] = {}
+        self._stamps: Dict[str, Tuple] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Optional[asyncio.Future] = None
+        self._scanner = None
+
+    @property
+    def latest(self) -> Optional[View]:
+        """Devices found in the latest scan that has been read, without reading it again."""
+        return self._views.get("devices")
+
+    def start(self) -> NoReturn:
+        """Starts scanning the router in the background, when there is a target."""
+        if self.target and not self._task:
+            from netsec.modules.scanner import MultiScan
+
+            self._scanner = MultiScan(targets=[self.target], max_workers=1)
+            self._ready = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._refresh())
+
+    async def stop(self) -> NoReturn:
+        """Stops scanning the router."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._scanner.shutdown()
+
+    def _scan(self) -> View:
+        """Scans the router, and converts the devices into a View."""
+        return View(items=[_item(record) for record in self._scanner.scan_target(target=self.target)])
+
+    async def _refresh(self) -> NoReturn:
+        """Scans the router every ``interval`` seconds, retaining the previous scan if one fails.
+
+        A scan that outlives its timeout is left to finish in its thread, and no other scan is started until it does.
+        """
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics()
+        while True:
+            start = loop.time()
+            if self._pending and not self._pending.done():
+                LOGGER.warning("Previous scan of the router is still running, skipping this interval.")
+            else:
+                self._pending = loop.run_in_executor(None, self._scan)
+                try:
+                    view = await asyncio.wait_for(asyncio.shield(self._pending), timeout=self.target.timeout)
+                except Exception as error:  # retains the previous scan, whatever the failure
+                    LOGGER.error("Failed to scan %s router at '%s': %s" %
+                                 (self.target.module.value, self.target.host or 'default', error or "timed out"))
+                    metrics.count("api_scans", result="failed")
+                else:
+                    self.scans += 1
+                    metrics.count("api_scans", result="ok")
+                    self._views["devices"] = view
+                    self._ready.set()
+            await asyncio.sleep(max(start + self.interval - loop.time(), 0))
+
+    async def _reload(self, name: str, stamp: Tuple, load: Callable[[], View]) -> View:
+        """Re-reads a resource in a thread, if its files have changed since the last read."""
+        if self._stamps.get(name) == stamp and name in self._views:
+            return self._views[name]
+        async with self._locks.setdefault(name, asyncio.Lock()):  # concurrent requests share the same read
+            if self._stamps.get(name) != stamp or name not in self._views:
+                self._views[name] = await asyncio.get_running_loop().run_in_executor(None, load)
+                self._stamps[name] = stamp
+        return self._views[name]
+
+    async def devices(self, timeout: float = None) -> Optional[View]:
+        """Returns the devices found in the latest scan.
+
+        Args:
+            timeout: Number of seconds to wait for the first scan of the router.
+
+        Returns:
+            View:
+            Returns the View of the devices, or ``None`` if the router has not been scanned yet.
+        """
+        if self.target:
+            if not self._ready.is_set():
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout=timeout or self.target.timeout)
+                except asyncio.TimeoutError:
+                    return
+            return self._views["devices"]
+        stamp = (file_stamp(config.last_scan),)
+        if stamp[0] is None:
+            return
+
+        def load() -> View:
+            """Reads the devices observed by the monitor in its latest scan."""
+            return View(items=[_item(record) for record in Tracker(filepath=config.last_scan).devices()],
+                        updated=stamp[0][0] / 1e9)
+
+        return await self._reload(name="devices", stamp=stamp, load=load)
+
+    async def snapshot(self) -> Optional[View]:
+        """Returns the devices in the snapshot, or ``None`` if a snapshot has not been created."""
+        stamp = (file_stamp(config.snapshot), file_stamp(config.snapshot_journal))
+        if stamp == (None, None):
+            return
+
+        def load() -> View:
+            """Reads the snapshot."""
+            from netsec.modules.snapshot import get_store
+
+            return View(items=[_item(record) for record in get_store().inventory()])
+
+        return await self._reload(name="snapshot", stamp=stamp, load=load)
+
+    async def blocked(self) -> Optional[View]:
+        """Returns the devices in the block ledger, which is empty until a device has been blocked."""
+        stamp = (file_stamp(config.blocked), file_stamp(config.blocked + "-wal"))
+        if stamp[0] is None:
+            return View(items=[])
+
+        def load() -> View:
+            """Reads the block ledger."""
+            from netsec.modules.ledger import get_ledger
+
+            return View(items=[dict(device, mac=device['mac'].upper(), status="Block") for device in get_ledger()])
+
+        return await self._reload(name="blocked", stamp=stamp, load=load)
+
+
+class InventoryServer:
+    """Read-only HTTP/JSON API for the cached inventory, served with ``asyncio`` and no additional dependencies.
+
+    >>> InventoryServer
+
+    See Also:
+        - ``GET /devices``, ``GET /snapshot`` and ``GET /blocked`` list the devices, ``GET /health`` reports the cache.
+        - Filters: ``mac``, ``ip`` and ``status``. Pagination: ``limit`` (upto 1000) and ``cursor`` from ``next``
+        - Every response has an ``ETag``, and ``If-None-Match`` is answered with ``304 Not Modified``
+    """
+
+    def __init__(self, cache: InventoryCache = None, host: str = "127.0.0.1", port: int = 8080,
+                 idle_timeout: float = 30):
+        """Instantiates the server, without binding to the port.
+
+        Args:
+            cache: Cache to serve. Defaults to reading the latest scan of a running monitor.
+            host: Interface to serve on.
+            port: Port to serve on.
+            idle_timeout: Number of seconds to keep an idle connection open.
+        """
+        self.cache = cache or InventoryCache()
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._routes = {"/devices": self.cache.devices, "/snapshot": self.cache.snapshot,
+                        "/blocked": self.cache.blocked}
+
+    async def start(self) -> NoReturn:
+        """Binds to the port, and starts the background scans of the cache."""
+        self.cache.start()
+        self._server = await asyncio.start_server(self._handle, host=self.host, port=self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        LOGGER.info("Serving the inventory on http://%s:%d" % (self.host, self.port))
+
+    async def stop(self) -> NoReturn:
+        """Stops serving, and stops the background scans of the cache."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.cache.stop()
+
+    async def serve_forever(self) -> NoReturn:
+        """Serves until the task is cancelled."""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> NoReturn:
+        """Serves the requests on a connection, keeping it alive between requests."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    method, target, version = "", "", "HTTP/1.0"
+                headers = {}
+                for line in lines[1:]:
+                    if line:
+                        name, _, value = line.partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                status, response_headers, body = await self.respond(method=method, target=target, headers=headers)
+                keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                              and method in ("GET", "HEAD") and not headers.get("content-length"))
+                response_headers["Connection"] = "keep-alive" if keep_alive else "close"
+                response_headers["Content-Length"] = str(len(body))
+                writer.write(("HTTP/1.1 %d %s\r\n" % (status, _REASONS[status])).encode() +
+                             "".join("%s: %s\r\n" % header for header in response_headers.items()).encode() +
+                             b"\r\n" + (b"" if method == "HEAD" else body))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            return
+        finally:
+            writer.close()
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """Responds to a request.
+
+        Args:
+            method: Method of the request.
+            target: Path and query of the request.
+            headers: Headers of the request, with lowercase names.
+
+        Returns:
+            Tuple[int, Dict[str, str], bytes]:
+            Returns the status code, the headers and the body of the response.
+        """
+        metrics = get_metrics()
+        status, response_headers, body = await self._respond(method=method, target=target, headers=headers)
+        metrics.count("api_requests", path=urlsplit(target).path if status != 404 else "other", status=str(status))
+        return status, response_headers, body
+
+    async def _respond(self, method: str, target: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """Routes a request, and renders the page of items."""
+        json_headers = {"Content-Type": "application/json", "Cache-Control": "no-cache"}
+        if method not in ("GET", "HEAD"):
+            return 405, dict(json_headers, Allow="GET, HEAD"), b'{"error": "method not allowed"}'
+        url = urlsplit(target)
+        if url.path == "/health":
+            devices = self.cache.latest
+            return 200, json_headers, json.dumps(dict(
+                scans=self.cache.scans, interval=self.cache.interval if self.cache.target else None,
+                devices=len(devices.items) if devices else None, updated=devices.updated if devices else None
+            )).encode()
+        if url.path not in self._routes:
+            return 404, json_headers, b'{"error": "not found"}'
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            limit = int(query.get("limit", LIMIT))
+            if not 0 < limit <= MAX_LIMIT:
+                raise ValueError
+            if query.get("cursor"):
+                _decode(query["cursor"])
+        except ValueError:
+            return 400, json_headers, json.dumps(dict(
+                error="limit should be between 1 and %d, and cursor should be the 'next' of a page" % MAX_LIMIT
+            )).encode()
+        if not (view := await self._routes[url.path]()):
+            return 503, dict(json_headers, **{"Retry-After": "5"}), b'{"error": "not available yet"}'
+        etag = '"%s-%s"' % (view.etag, hashlib.sha1(json.dumps(sorted(query.items())).encode()).hexdigest()[:8])
+        if etag in headers.get("if-none-match", "") or headers.get("if-none-match") == "*":
+            return 304, dict(json_headers, ETag=etag), b""
+        items, cursor = view.page(mac=query.get("mac"), ip=query.get("ip"), status=query.get("status"),
+                                  cursor=query.get("cursor"), limit=limit)
+        return 200, dict(json_headers, ETag=etag), json.dumps(dict(
+            items=items, next=cursor, total=len(view.items), updated=view.updated
+        ), default=str).encode()
+
+    def run(self) -> NoReturn:
+        """Serves until interrupted."""
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
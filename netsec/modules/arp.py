@@ -0,0 +1,172 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, NoReturn, Optional
+
+from netsec.modules.att import get_ipaddress
+from netsec.modules.helper import process_scan
+from netsec.modules.inventory import Inventory, Record
+from netsec.modules.metrics import get_metrics, timed
+from netsec.modules.oui import vendor_info
+from netsec.modules.settings import LOGGER
+from netsec.modules.snapshot import get_store
+
+ARP_TABLE = "/proc/net/arp"
+_COMPLETE = 0x2
+
+
+class Neighbor(NamedTuple):
+    """Entry in the kernel's ARP table.
+
+    >>> Neighbor
+
+    """
+
+    ip: str
+    mac: str
+    interface: str
+
+
+def read_arp_table(filepath: str = ARP_TABLE) -> List[Neighbor]:
+    """Reads the resolved entries from the kernel's ARP table.
+
+    Args:
+        filepath: Path of the ARP table.
+
+    Returns:
+        List[Neighbor]:
+        Returns the neighbors that have a MAC address, skipping incomplete entries.
+    """
+    if not os.path.isfile(filepath):
+        raise ValueError(
+            "\n\n'%s' is not available, ARP backend is only supported on Linux" % filepath
+        )
+    neighbors = []
+    with open(filepath) as file:
+        next(file, None)  # header
+        for line in file:
+            if len(columns := line.split()) < 6:
+                continue
+            try:
+                if not int(columns[2], 16) & _COMPLETE:
+                    continue
+            except ValueError:
+                continue
+            neighbors.append(Neighbor(ip=columns[0], mac=columns[3].upper(), interface=columns[5]))
+    return neighbors
+
+
+def sweep(network_id: str = None, parallelism: int = 64, settle: float = 0.5) -> int:
+    """Sends a UDP datagram to every host in the ``/24`` subnet, so that the kernel resolves them with ARP.
+
+    Sending a datagram does not require elevated privileges, and the kernel sends an ARP request for every
+    host that is not in its ARP table already. Hosts that respond are added to the table, which is then read
+    by ``read_arp_table``
+
+    Args:
+        network_id: First three octets of the subnet. Defaults to the subnet of the current IP address.
+        parallelism: Number of hosts probed at once, to avoid overflowing the kernel's ARP queue.
+        settle: Number of seconds to wait for the hosts to respond, after the last probe.
+
+    Returns:
+        int:
+        Returns the number of hosts probed.
+    """
+    network_id = network_id or get_ipaddress()
+    hosts = ["%s.%d" % (network_id, host) for host in range(1, 255)]
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as socket_:
+        socket_.setblocking(False)
+        for index in range(0, len(hosts), parallelism):
+            for host in hosts[index:index + parallelism]:
+                try:
+                    socket_.sendto(b"", (host, 9))  # discard protocol
+                except OSError:  # host unreachable, or the send buffer is full
+                    pass
+            time.sleep(0.01)
+    time.sleep(settle)
+    return len(hosts)
+
+
+def get_attached_devices(active: bool = True, network_id: str = None) -> List[Neighbor]:
+    """Get all devices on the local subnet.
+
+    Args:
+        active: Sweeps the subnet before reading the ARP table, to find hosts that haven't talked to this machine.
+        network_id: First three octets of the subnet. Defaults to the subnet of the current IP address.
+
+    Returns:
+        List[Neighbor]:
+        Returns the devices found in the ARP table.
+    """
+    metrics = get_metrics()
+    network_id = network_id or get_ipaddress()
+    if active:
+        with metrics.time("fetch", backend="arp"):
+            sweep(network_id=network_id)
+    with metrics.time("parse", backend="arp"):
+        return [neighbor for neighbor in read_arp_table() if neighbor.ip.startswith(network_id + ".")]
+
+
+def resolve_name(ip: str) -> Optional[str]:
+    """Resolves the hostname of a device with a reverse DNS lookup."""
+    try:
+        return socket.gethostbyaddr(ip)[0]
+    except OSError:
+        return
+
+
+def to_record(device: Neighbor, name: str = None) -> Record:
+    """Converts a Neighbor object into a Record.
+
+    Args:
+        device: Takes Neighbor object as an argument.
+        name: Hostname of the device.
+
+    Returns:
+        Record:
+        Returns a Record object.
+    """
+    return Record(mac=device.mac, ip=device.ip, name=name, type=device.interface, device=device)
+
+
+def intruder(record: Record) -> Dict[str, str]:
+    """Logs a device that is not present in the snapshot, resolving its hostname if it is not known already.
+
+    Args:
+        record: Takes the Record object of the device as an argument.
+
+    Returns:
+        Dict[str, str]:
+        Returns the device information to be notified.
+    """
+    record.name = record.name or resolve_name(record.ip)
+    LOGGER.warning('{name} [{ip}: {mac}] is connected to your network.'.format(name=record.name,
+                                                                               mac=record.mac,
+                                                                               ip=record.ip))
+    return dict(Name=record.name, MAC=record.mac, IP=record.ip, **vendor_info(mac=record.mac))
+
+
+def create_snapshot() -> NoReturn:
+    """Creates a snapshot.json which is used to determine the known and unknown devices."""
+    neighbors = get_attached_devices()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        names = executor.map(resolve_name, [neighbor.ip for neighbor in neighbors])
+    devices = Inventory(to_record(device=neighbor, name=name) for neighbor, name in zip(neighbors, names))
+    LOGGER.info('Number of devices connected: %d' % len(devices))
+    get_store().save(records=devices)
+
+
+@timed("scan", backend="arp")
+def run() -> List[Neighbor]:
+    """Trigger to initiate a Network Scan and alert on the devices that are not present in ``snapshot.json`` file.
+
+    Hostnames are resolved only for the devices that are not present in the snapshot.
+
+    Returns:
+        List[Neighbor]:
+        Returns the list of devices that were found during the scan.
+    """
+    devices = get_attached_devices()
+    process_scan(current=Inventory(to_record(device=device) for device in devices), backend="arp", intruder=intruder)
+    return devices
@@ -1,16 +1,26 @@
-import json
-import os
+import codecs
+import functools
+import hashlib
+import html
+import random
+import re
 import socket
-from collections.abc import Generator
-from typing import Any, NoReturn, Optional, Union
+import time
+from collections.abc import Generator, Iterable
+from typing import Any, Dict, List, NoReturn, Optional, Tuple, Union
 
-import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 
-from netsec.modules.helper import notify
-from netsec.modules.settings import LOGGER, config
+from netsec.modules.helper import process_scan
+from netsec.modules.inventory import Inventory, Record
+from netsec.modules.metrics import get_metrics, timed
+from netsec.modules.oui import vendor_info
+from netsec.modules.settings import LOGGER
+from netsec.modules.snapshot import get_store
+from netsec.modules.telemetry import Sample, to_number
 
-SOURCE = "http://{NETWORK_ID}.254/cgi-bin/devices.ha"
+SOURCE_TEMPLATE = "http://{NETWORK_ID}.254/cgi-bin/devices.ha"
 
 
 def get_ipaddress() -> str:
@@ -27,7 +37,17 @@ def get_ipaddress() -> str:
     return network_id
 
 
-SOURCE = SOURCE.format(NETWORK_ID=get_ipaddress())
+@functools.lru_cache(maxsize=None)
+def get_source() -> str:
+    """Get the URL of the devices page, using the network id of the current IP address upon first call."""
+    return SOURCE_TEMPLATE.format(NETWORK_ID=get_ipaddress())
+
+
+def __getattr__(name: str) -> str:
+    """Resolves ``SOURCE`` lazily, to avoid network calls when the module is imported."""
+    if name == "SOURCE":
+        return get_source()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 class Device:
@@ -37,11 +57,17 @@ class Device:
 
     """
 
+    __slots__ = ("mac_address", "ipv4_address", "name", "last_activity", "status", "allocation",
+                 "connection_type", "connection_speed", "mesh_client", "extras")
+
     def __init__(self, dictionary: dict):
         """Set dictionary keys as attributes of Device object.
 
         Args:
             dictionary: Takes the input dictionary as an argument.
+
+        See Also:
+            Keys that are not a part of the known attributes are stored in ``extras``.
         """
         self.mac_address: Optional[str] = None
         self.ipv4_address: Optional[str] = None
@@ -52,94 +78,415 @@ class Device:
         self.connection_type: Optional[str] = None
         self.connection_speed: Optional[Union[float, Any]] = None
         self.mesh_client: Optional[str] = None
+        self.extras: Dict[str, Any] = {}
         for key in dictionary:
-            setattr(self, key, dictionary[key])
+            if key in self.__slots__:
+                setattr(self, key, dictionary[key])
+            else:
+                self.extras[key] = dictionary[key]
+
+
+def format_key(key: str) -> str:
+    """Format the key to match the Device object."""
+    return key.lower().replace(' ', '_').replace('-', '_')
 
 
-def generate_dataframe() -> pd.DataFrame:
-    """Generate a dataframe using the devices information from router web page.
+class DevicesParser:
+    """Incremental parser that converts the first table in ``devices.ha`` page into Device objects.
 
-    Returns:
-        pd.DataFrame:
-        Devices list as a data frame.
+    >>> DevicesParser
+
+    See Also:
+        - The page has a fixed layout of ``<tr><th>key</th><td>value</td></tr>`` rows, so only the table, row and
+          cell tags are tokenized with a single regular expression, instead of parsing every tag in the page.
+        - Any other markup within a cell is stripped, and character references are unescaped.
     """
-    # pd.set_option('display.max_rows', None)
-    try:
-        response = requests.get(url=SOURCE)
-    except requests.RequestException as error:
-        LOGGER.error(error)
-        raise ConnectionError(error.args)
-    else:
-        if response.ok:
-            html_source = response.text
-            try:
-                html_tables = pd.read_html(html_source)
-            except ImportError:
-                raise ValueError("No tables found")
-            return html_tables[0]
+
+    _tag = re.compile(r"<(/?)(table|tr|th|td)\b[^>]*>", re.IGNORECASE)
+    _markup = re.compile(r"<[^>]*>")
+    _whitespace = re.compile(r"[\r\n]+|\s{2,}")
+
+    def __init__(self):
+        """Initiates the parser with an empty queue of parsed devices."""
+        self.devices: List[Device] = []
+        self._device_info: Dict[str, str] = {}
+        self._done = False
+        self._depth = 0
+        self._row: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+        self._pending = ""
+
+    def feed(self, data: str) -> NoReturn:
+        """Tokenizes a chunk of the page, holding back a tag that is split across chunks."""
+        if self._done:
+            return
+        data = self._pending + data
+        if (start := data.rfind("<")) > data.rfind(">"):
+            data, self._pending = data[:start], data[start:]
         else:
-            LOGGER.error("[%s] - %s" % (response.status_code, response.text))
+            self._pending = ""
+        position = 0
+        for match in self._tag.finditer(data):
+            if self._cell is not None:
+                self._cell.append(data[position:match.start()])
+            position = match.end()
+            if match.group(1):
+                self._end_tag(tag=match.group(2).lower())
+            else:
+                self._start_tag(tag=match.group(2).lower())
+            if self._done:
+                return
+        if self._cell is not None:
+            self._cell.append(data[position:])
 
+    def close(self) -> NoReturn:
+        """Treats the text held back at the end of the page as cell data."""
+        if self._cell is not None:
+            self._cell.append(self._pending)
+        self._pending = ""
 
-def format_key(key: str) -> str:
-    """Format the key to match the Device object."""
-    return key.lower().replace(' ', '_').replace('-', '_')
+    def _start_tag(self, tag: str) -> NoReturn:
+        """Tracks the table, row and cell being parsed."""
+        if tag == "table":
+            self._depth += 1
+        elif self._depth != 1:
+            return
+        elif tag == "tr":
+            self._end_row()
+            self._row = []
+        elif self._row is not None:
+            self._end_cell()
+            self._cell = []
+
+    def _end_tag(self, tag: str) -> NoReturn:
+        """Closes the table, row or cell being parsed."""
+        if tag == "table" and self._depth:
+            if self._depth == 1:
+                self._end_row()
+                self._flush()
+                self._done = True
+            self._depth -= 1
+        elif self._depth != 1:
+            return
+        elif tag == "tr":
+            self._end_row()
+        elif tag != "table":
+            self._end_cell()
+
+    def _end_cell(self) -> NoReturn:
+        """Adds the text of the current cell to the current row."""
+        if self._cell is not None:
+            text = "".join(self._cell)
+            if "<" in text:
+                text = self._markup.sub("", text)
+            if "&" in text:
+                text = html.unescape(text)
+            self._row.append(self._whitespace.sub(" ", text).strip())
+            self._cell = None
+
+    def _end_row(self) -> NoReturn:
+        """Maps the current row to the device information, using the same keys as ``format_key``."""
+        self._end_cell()
+        if self._row is None:
+            return
+        row, self._row = self._row, None
+        if not row or not row[0]:
+            self._flush()
+        elif row[0] == "IPv4 Address / Name":
+            key = row[0].split('/')
+            val = row[1].split('/') if len(row) > 1 else ["", ""]
+            self._device_info[format_key(key[0].strip())] = val[0].strip()
+            self._device_info[format_key(key[1].strip())] = val[1].strip() if len(val) > 1 else ""
+        else:
+            self._device_info[format_key(row[0])] = row[1] if len(row) > 1 and row[1] else None
+
+    def _flush(self) -> NoReturn:
+        """Queues the device information collected so far as a Device object."""
+        if self._device_info:
+            self.devices.append(Device(self._device_info))
+            self._device_info = {}
+
+    def parse(self, chunks: Iterable[str]) -> Generator[Device]:
+        """Feeds the chunks to the parser and yields each device as soon as its section is complete.
+
+        Args:
+            chunks: Takes an iterable of HTML text chunks as an argument.
+
+        Yields:
+            Generator[Device]:
+            Yields each device information as a Device object.
+        """
+        for chunk in chunks:
+            self.feed(chunk)
+            yield from self._drain()
+        self.close()
+        self._end_row()
+        self._flush()
+        yield from self._drain()
+
+    def _drain(self) -> Generator[Device]:
+        """Yields and clears the queued devices."""
+        devices, self.devices = self.devices, []
+        yield from devices
+
+
+class DevicesClient:
+    """Pooled HTTP client for the ``devices.ha`` page, that skips parsing when the page has not changed.
+
+    >>> DevicesClient
+
+    """
+
+    def __init__(self,
+                 source: str = None,
+                 connect_timeout: float = 3.05,
+                 read_timeout: float = 15,
+                 retries: int = 3,
+                 backoff: float = 0.5,
+                 pool_size: int = 2,
+                 chunk_size: int = 8_192):
+        """Instantiates a session that keeps the connections to the router alive.
+
+        Args:
+            source: URL of the devices page. Defaults to the gateway in the current network.
+            connect_timeout: Number of seconds to wait for a connection to the router.
+            read_timeout: Number of seconds to wait for the router to send the page.
+            retries: Number of times to retry when the router is unreachable or responds with a server error.
+            backoff: Base delay in seconds between retries, which doubles after each attempt with a random jitter.
+            pool_size: Number of connections to keep alive.
+            chunk_size: Number of bytes to read from the response at a time.
+        """
+        self.source = source or get_source()
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._digest: Optional[str] = None
+        self._devices: List[Device] = []
+
+    def _request(self, timeout: Tuple[float, float]) -> requests.Response:
+        """Requests the devices page with conditional headers, retrying with an exponential backoff and jitter.
+
+        Args:
+            timeout: Connect and read timeouts in seconds.
+
+        Returns:
+            requests.Response:
+            Returns the response from the router.
+        """
+        headers = {}
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url=self.source, headers=headers, timeout=timeout, stream=True)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt == self.retries:
+                    LOGGER.error(error)
+                    raise ConnectionError(error.args)
+                LOGGER.warning("Attempt %d to reach %s failed: %s" % (attempt + 1, self.source, error))
+            except requests.RequestException as error:
+                LOGGER.error(error)
+                raise ConnectionError(error.args)
+            else:
+                if response.status_code < 500 or attempt == self.retries:
+                    return response
+                response.close()
+                LOGGER.warning("Attempt %d to reach %s failed: [%d]" % (attempt + 1, self.source,
+                                                                        response.status_code))
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def _read(self, response: requests.Response) -> Tuple[List[bytes], str]:
+        """Reads the response body as it is streamed, while computing its digest.
+
+        Args:
+            response: Streamed response from the router.
 
+        Returns:
+            Tuple[List[bytes], str]:
+            Returns the chunks of the page, and the digest of the page.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        chunks = []
+        try:
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                digest.update(chunk)
+                chunks.append(chunk)
+        except requests.RequestException as error:
+            LOGGER.error(error)
+            raise ConnectionError(error.args)
+        return chunks, digest.hexdigest()
+
+    def get_attached_devices(self, timeout: Optional[float] = None) -> List[Device]:
+        """Get all devices connected to the router, re-using the previous devices if the page is unchanged.
+
+        Args:
+            timeout: Overall timeout in seconds, that caps both connect and read timeouts.
+
+        See Also:
+            The page is hashed as it is streamed, and parsed only when its digest differs from the previous page.
+            Otherwise, the devices from the previous page are returned so the objects remain the same across scans.
+            Raises ``ConnectionError`` when the router is unreachable or responds with an error, so that the scan is
+            skipped instead of treating every device as disconnected.
+
+        Returns:
+            List[Device]:
+            Returns the list of devices connected to the router.
+        """
+        with get_metrics().time("fetch", backend="att"):
+            if timeout:
+                response = self._request(timeout=(min(self.timeout[0], timeout), min(self.timeout[1], timeout)))
+            else:
+                response = self._request(timeout=self.timeout)
+            with response:
+                if response.status_code == 304:
+                    LOGGER.debug("Devices page has not changed since the last scan.")
+                    return self._devices
+                if not response.ok:
+                    LOGGER.error("[%s] - %s" % (response.status_code, response.text))
+                    raise ConnectionError("Failed to get the devices page: [%s]" % response.status_code)
+                chunks, digest = self._read(response=response)
+        self._etag = response.headers.get('ETag')
+        self._last_modified = response.headers.get('Last-Modified')
+        if digest == self._digest:
+            LOGGER.debug("Devices page has not changed since the last scan.")
+            return self._devices
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        with get_metrics().time("parse", backend="att"):
+            devices = list(DevicesParser().parse(decoder.decode(chunk, final=index == len(chunks) - 1)
+                                                 for index, chunk in enumerate(chunks)))
+        self._devices, self._digest = devices, digest
+        return devices
+
+    async def get_attached_devices_async(self, timeout: Optional[float] = None) -> List[Device]:
+        """Get all devices connected to the router, without blocking the event loop.
+
+        Args:
+            timeout: Overall timeout in seconds, that caps both connect and read timeouts.
+
+        Returns:
+            List[Device]:
+            Returns the list of devices connected to the router.
+        """
+        import asyncio
 
-def get_attached_devices() -> Generator[Device]:
+        return await asyncio.to_thread(self.get_attached_devices, timeout)
+
+    def close(self) -> NoReturn:
+        """Closes the connections to the router."""
+        self.session.close()
+
+
+_CLIENTS: Dict[str, DevicesClient] = {}
+
+
+def get_client(source: str = None) -> DevicesClient:
+    """Returns the client for the devices page, which retains the connection and the last response across scans.
+
+    Args:
+        source: URL of the devices page. Defaults to the gateway in the current network.
+
+    Returns:
+        DevicesClient:
+        Returns a DevicesClient object.
+    """
+    source = source or get_source()
+    if source not in _CLIENTS:
+        _CLIENTS[source] = DevicesClient(source=source)
+    return _CLIENTS[source]
+
+
+def get_attached_devices(source: str = None, timeout: Optional[float] = None,
+                         chunk_size: int = None) -> Generator[Device]:
     """Get all devices connected to the router.
 
+    Args:
+        source: URL of the devices page. Defaults to the gateway in the current network.
+        timeout: Overall timeout in seconds, that caps both connect and read timeouts.
+        chunk_size: Number of bytes to read from the response at a time. Defaults to the client's chunk size.
+
     Yields:
         Generator[Device]:
         Yields each device information as a Device object.
     """
-    device_info = {}
-    dataframe = generate_dataframe()
-    if dataframe is None:
-        return
-    for value in dataframe.values:
-        if str(value[0]) == "nan":
-            yield Device(device_info)
-            device_info = {}
-        elif value[0] == "IPv4 Address / Name":
-            key = value[0].split('/')
-            val = value[1].split('/')
-            device_info[format_key(key[0].strip())] = val[0].strip()
-            device_info[format_key(key[1].strip())] = val[1].strip()
-        else:
-            device_info[format_key(value[0])] = value[1]
+    client = get_client(source=source)
+    if chunk_size:
+        client.chunk_size = chunk_size
+    yield from client.get_attached_devices(timeout=timeout)
+
+
+def to_record(device: Device) -> Record:
+    """Converts a Device object into a Record.
+
+    Args:
+        device: Takes Device object as an argument.
+
+    Returns:
+        Record:
+        Returns a Record object.
+    """
+    return Record(mac=device.mac_address, ip=device.ipv4_address, name=device.name,
+                  type=device.connection_type, status=device.status, device=device)
+
+
+def sample(record: Record) -> Sample:
+    """Extracts the telemetry of a device, from the Record object of a scan.
+
+    Args:
+        record: Takes the Record object of the device as an argument.
+
+    Returns:
+        Sample:
+        Returns the connection speed, and the connection type and mesh client as the location of the device.
+    """
+    device = record.device
+    location = "%s / mesh %s" % (device.connection_type, device.mesh_client) if device.connection_type else None
+    return Sample(mac=record.mac, signal=float("nan"), rate=to_number(device.connection_speed), location=location)
+
+
+def intruder(record: Record) -> Dict[str, str]:
+    """Logs a device that is not present in the snapshot.
+
+    Args:
+        record: Takes the Record object of the device as an argument.
+
+    Returns:
+        Dict[str, str]:
+        Returns the device information to be notified.
+    """
+    # REMOTE = "http://{NETWORK_ID}.254/cgi-bin/remoteaccess.ha"
+    LOGGER.warning('{name} [{ip}: {mac}] is connected to your network.'.format(name=record.name,
+                                                                               mac=record.device.mac_address,
+                                                                               ip=record.ip))
+    return dict(Name=record.name, MAC=record.mac, IP=record.ip, **vendor_info(mac=record.mac))
 
 
 def create_snapshot() -> NoReturn:
     """Creates a snapshot.json which is used to determine the known and unknown devices."""
-    devices = {}
-    for device in get_attached_devices():
-        if device.ipv4_address:
-            devices[device.ipv4_address] = [str(device.name), str(device.connection_type), str(device.last_activity)]
-    LOGGER.info('Number of devices connected: %d' % len(devices.keys()))
-    with open(config.snapshot, 'w') as file:
-        json.dump(devices, file, indent=2)
-
-
-def run() -> NoReturn:
-    """Trigger to initiate a Network Scan and block the devices that are not present in ``snapshot.json`` file."""
-    if not os.path.isfile(config.snapshot):
-        LOGGER.error("'%s' not found. Please pass `init=True` to generate snapshot and review it." % config.snapshot)
-        raise FileNotFoundError(
-            "'%s' is required" % config.snapshot
-        )
-    with open(config.snapshot) as file:
-        device_list = json.load(file)
-    stored_ips = list(device_list.keys())
-    threats = []
-    for device in get_attached_devices():
-        if device.ipv4_address and device.ipv4_address not in stored_ips:
-            # REMOTE = "http://{NETWORK_ID}.254/cgi-bin/remoteaccess.ha"
-            LOGGER.warning('{name} [{ip}: {mac}] is connected to your network.'.format(name=device.name,
-                                                                                       mac=device.mac_address,
-                                                                                       ip=device.ipv4_address))
-            threats.append(dict(Name=device.name, MAC=device.mac_address.upper(), IP=device.ipv4_address))
-    if threats:
-        notify(msg_dict=threats)
-    else:
-        LOGGER.info('NetSec has completed. No threats found on your network.')
+    devices = Inventory(Record(mac=device.mac_address, ip=device.ipv4_address, name=str(device.name),
+                               type=str(device.connection_type), status=str(device.status))
+                        for device in get_attached_devices() if device.ipv4_address)
+    LOGGER.info('Number of devices connected: %d' % len(devices))
+    get_store().save(records=devices)
+
+
+@timed("scan", backend="att")
+def run() -> List[Device]:
+    """Trigger to initiate a Network Scan and block the devices that are not present in ``snapshot.json`` file.
+
+    Returns:
+        List[Device]:
+        Returns the list of devices that were connected during the scan.
+    """
+    devices = list(get_attached_devices())
+    process_scan(current=Inventory(to_record(device=device) for device in devices if device.ipv4_address),
+                 backend="att", intruder=intruder, sample=sample)
+    return devices
@@ -0,0 +1,322 @@
+import atexit
+import functools
+import json
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime
+from typing import (TYPE_CHECKING, Callable, Dict, List, NoReturn, Optional,
+                    Tuple)
+
+from netsec.modules.metrics import get_metrics
+from netsec.modules.settings import LOGGER, config, make_dirs
+from netsec.modules.state import atomic_write, file_lock
+
+if TYPE_CHECKING:
+    import gmailconnector as gc
+    import jinja2
+
+SMS_LIMIT = 428  # payload limit of gmail-connector, including the From, To and Subject headers
+
+
+@functools.lru_cache(maxsize=1)
+def get_template() -> "jinja2.Template":
+    """Reads and compiles the email template upon first call.
+
+    Returns:
+        jinja2.Template:
+        Returns the compiled template.
+    """
+    import jinja2
+
+    with open(os.path.join(os.path.dirname(__file__), 'email_template.html')) as file:
+        return jinja2.Template(file.read())
+
+
+def _log_response(response: "gc.Response") -> bool:
+    """Log response from gmail-connector."""
+    if response.ok:
+        LOGGER.info(response.body)
+        return True
+    LOGGER.error("Failed to send a notification.\n%s" % response.body)
+    return False
+
+
+def _coalesce(lines: List[str]) -> List[Dict[str, str]]:
+    """Parses the entries of the queue, and coalesces the alerts for the same device into one."""
+    alerts = {}
+    for line in lines:
+        try:
+            entries = json.loads(line)
+        except ValueError:  # partially written entry
+            continue
+        for alert in entries:
+            alerts[(alert.get('MAC'), alert.get('IP'))] = alert
+    return [{key: value for key, value in sorted(alert.items(), key=lambda item: len(item[0]))}
+            for alert in alerts.values()]
+
+
+def split_sms(alerts: List[Dict[str, str]], limit: int) -> List[str]:
+    """Packs the alerts into as few text messages as possible, without splitting an alert across two messages.
+
+    Args:
+        alerts: List of alerts to be notified.
+        limit: Maximum number of characters in each message.
+
+    Returns:
+        List[str]:
+        Returns the messages, where an alert longer than the limit is truncated.
+    """
+    messages, message = [], ""
+    for alert in alerts:
+        part = "".join("%s: %s\n" % (key, value) for key, value in alert.items())[:limit - 1] + "\n"
+        if message and len(message) + len(part) > limit:
+            messages.append(message)
+            message = ""
+        message += part
+    if message:
+        messages.append(message)
+    return messages
+
+
+def _send_sms(client: "gc.SendSMS", message: str, subject: str) -> "gc.Response":
+    """Sends a text message to the phone number in the config."""
+    return client.send_sms(phone=config.phone, message=message, subject=subject)
+
+
+def _last_notified() -> float:
+    """Reads the time when the last notification was sent."""
+    if os.path.isfile(config.notification):
+        with open(config.notification) as file:
+            try:
+                return float(file.read().strip())
+            except ValueError:
+                pass
+    return 0
+
+
+class Dispatcher:
+    """Delivers notifications in the background, using a queue on disk so that no alert is lost.
+
+    >>> Dispatcher
+
+    See Also:
+        - Alerts are appended to the queue and delivered by a background thread, so scans don't wait on SMTP.
+        - Alerts raised within ``cooldown`` seconds of the last notification are held in the queue,
+          and delivered together as one message per channel once the cooldown expires.
+          Text messages are split to fit the payload limit of the SMS gateway.
+        - Delivery is acknowledged per channel, so a channel that fails is retried without resending
+          the others. Entries are removed from the queue once every channel has delivered them.
+        - Repeated alerts for the same device are suppressed before they are queued, by ``alerts.AlertState``
+        - SMTP connections are re-used across notifications, and re-created when the server drops them.
+        - The queue and ``last_notify`` are locked across processes, so that monitors running on the same host
+          share the cooldown and deliver each alert once.
+    """
+
+    def __init__(self, cooldown: float = 60, retry: float = 60, queue: str = None):
+        """Instantiates the dispatcher.
+
+        Args:
+            cooldown: Minimum number of seconds between two notifications.
+            retry: Number of seconds to wait before retrying a failed delivery.
+            queue: Path of the queue file. Defaults to ``config.notification_queue``
+        """
+        self.cooldown = cooldown
+        self.retry = retry
+        self.queue = queue or config.notification_queue
+        self.acks = self.queue + ".acks"
+        self._lock = threading.Lock()
+        self._queue_lock = file_lock(filepath=self.queue)
+        self._delivering = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._failed_at = 0
+        self._clients: Dict[str, object] = {}
+
+    def submit(self, alerts: List[Dict[str, str]]) -> NoReturn:
+        """Adds the alerts to the queue, and wakes up the background thread to deliver them.
+
+        Args:
+            alerts: List of alerts to be notified.
+        """
+        with self._queue_lock.hold():
+            make_dirs(filepath=self.queue)
+            with open(self.queue, 'a') as file:
+                file.write(json.dumps(alerts) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+        self.resume()
+
+    def resume(self) -> NoReturn:
+        """Starts the background thread if there are alerts in the queue, including the ones held by previous runs."""
+        with self._lock:
+            if not os.path.isfile(self.queue) or not os.path.getsize(self.queue):
+                return
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="netsec-notify", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _pending(self) -> Tuple[List[str], Dict[str, int]]:
+        """Reads the queue, and the number of entries from the start of the queue delivered through each channel.
+
+        Returns:
+            Tuple[List[str], Dict[str, int]]:
+            Returns the entries in the queue, and the number of entries delivered per channel.
+        """
+        with self._queue_lock.hold(shared=True):
+            if not os.path.isfile(self.queue):
+                return [], {}
+            with open(self.queue) as file:
+                lines = file.readlines()
+            offsets = {}
+            if os.path.isfile(self.acks):
+                with open(self.acks) as file:
+                    try:
+                        offsets = json.load(file)
+                    except ValueError as error:
+                        LOGGER.error("Failed to load %s: %s" % (self.acks, error))
+        return lines, offsets
+
+    def _acknowledge(self, offsets: Dict[str, int]) -> NoReturn:
+        """Records the entries delivered through each channel, and removes the ones delivered through all of them.
+
+        Args:
+            offsets: Number of entries from the start of the queue, delivered through each channel.
+        """
+        count = min(offsets.values())
+        with self._queue_lock.hold():
+            if count:
+                with open(self.queue) as file:
+                    lines = file.readlines()
+                atomic_write(filepath=self.queue, data="".join(lines[count:]))  # retains the entries added since
+            if offsets := {channel: offset - count for channel, offset in offsets.items() if offset > count}:
+                atomic_write(filepath=self.acks, data=json.dumps(offsets))
+            elif os.path.isfile(self.acks):
+                os.remove(self.acks)
+
+    def _wait_time(self) -> float:
+        """Returns the number of seconds to wait before the next delivery is allowed."""
+        now = time.time()
+        return max(_last_notified() + self.cooldown - now, self._failed_at + self.retry - now, 0)
+
+    def _worker(self) -> NoReturn:
+        """Delivers the queued alerts whenever the cooldown allows it."""
+        while True:
+            self._wakeup.clear()
+            if wait := self._wait_time():
+                self._wakeup.wait(timeout=wait)
+                continue
+            if not self.deliver():
+                self._wakeup.wait()
+
+    def deliver(self, timeout: float = -1) -> bool:
+        """Delivers all the queued alerts as one message per channel.
+
+        Args:
+            timeout: Maximum number of seconds to wait for an ongoing delivery. Waits indefinitely by default.
+
+        Returns:
+            bool:
+            Returns a boolean flag to indicate whether there were alerts to deliver.
+        """
+        if not self._delivering.acquire(timeout=timeout):
+            return False
+        try:
+            last_notified = _last_notified()
+            with file_lock(filepath=config.notification).hold():
+                if _last_notified() != last_notified:  # delivered by another process, while waiting for the lock
+                    return True
+                return self._deliver()
+        finally:
+            self._delivering.release()
+
+    def _deliver(self) -> bool:
+        """Delivers the queued alerts that each channel has not delivered yet, and records the time of delivery."""
+        lines, offsets = self._pending()
+        if not lines:
+            return False
+        count, sub = len(lines), f"NetSec Alert - {datetime.now().strftime('%c')}"
+        channels = [channel for channel, enabled in (('email', config.recipient), ('sms', config.phone)) if enabled]
+        delivered, sent, failed = {}, not channels, False
+        for channel in channels:
+            delivered[channel] = count
+            if not (alerts := _coalesce(lines=lines[offsets.get(channel, 0):])):
+                continue
+            if self._notify(channel=channel, alerts=alerts, subject=sub):
+                sent = True
+            else:
+                delivered[channel], failed = offsets.get(channel, 0), True
+        self._acknowledge(offsets=delivered or {'none': count})
+        if failed:
+            self._failed_at = time.time()
+        if sent:
+            atomic_write(filepath=config.notification, data=time.time().__str__())
+        return sent or failed
+
+    def _notify(self, channel: str, alerts: List[Dict[str, str]], subject: str) -> bool:
+        """Sends the alerts through the channel, as one email or as many text messages as needed to fit the limit."""
+        if channel == 'email':
+            return self._send('email', lambda client: client.send_email(
+                recipient=getattr(config.recipient, 'email', config.recipient), sender="NetSec",
+                subject=subject, html_body=get_template().render(alerts=alerts)
+            ))
+        import gmailconnector as gc
+
+        headers = "From: %s\nTo: +1%s@%s\nSubject: %s\n\n" % (
+            config.gmail_user, config.phone, gc.SMSGateway.tmobile, subject
+        )
+        messages = split_sms(alerts=alerts, limit=SMS_LIMIT - len(headers))
+        return all(self._send('sms', functools.partial(_send_sms, message=message, subject=subject))
+                   for message in messages)
+
+    def _client(self, channel: str) -> object:
+        """Returns the gmail-connector client for the channel, creating one if there isn't a connection already."""
+        if channel not in self._clients:
+            import gmailconnector as gc
+
+            client = gc.SendEmail if channel == 'email' else gc.SendSMS
+            self._clients[channel] = client(gmail_user=config.gmail_user, gmail_pass=config.gmail_pass)
+        return self._clients[channel]
+
+    def _send(self, channel: str, send: Callable[[object], "gc.Response"]) -> bool:
+        """Sends a notification through the channel, reconnecting once if the existing connection has failed.
+
+        The client is discarded whenever the notification is not delivered, since gmail-connector connects when it is
+        instantiated, and responds with an error instead of reconnecting when that connection has failed.
+        """
+        metrics = get_metrics()
+        start = time.perf_counter()
+        delivered = False
+        for _ in range(2):
+            try:
+                delivered = _log_response(response=send(self._client(channel=channel)))
+            except (smtplib.SMTPException, OSError) as error:
+                LOGGER.warning("Connection for %s notification failed: %s" % (channel, error))
+            if delivered:
+                break
+            self._clients.pop(channel, None)
+        metrics.observe("notification_seconds", time.perf_counter() - start, channel=channel)
+        metrics.count("notifications", channel=channel, result="ok" if delivered else "failed")
+        return delivered
+
+    def close(self, timeout: float = 30) -> NoReturn:
+        """Delivers the queued alerts if the cooldown allows it, so that a short-lived process doesn't exit early.
+
+        Args:
+            timeout: Maximum number of seconds to wait for an ongoing delivery.
+        """
+        if self._thread and self._thread.is_alive() and not self._wait_time():
+            self.deliver(timeout=timeout)
+
+
+_DISPATCHERS: Dict[str, Dispatcher] = {}
+
+
+def get_dispatcher() -> Dispatcher:
+    """Returns the dispatcher for the current ``config.notification_queue``, which delivers pending alerts on exit."""
+    if config.notification_queue not in _DISPATCHERS:
+        _DISPATCHERS[config.notification_queue] = dispatcher = Dispatcher()
+        atexit.register(dispatcher.close)
+    return _DISPATCHERS[config.notification_queue]
@@ -0,0 +1,151 @@
+import json
+import os
+from typing import Dict, List, NamedTuple, NoReturn, Optional, Set, Tuple
+
+from netsec.modules.inventory import Inventory, Record
+from netsec.modules.models import DeviceStatus, EventType
+from netsec.modules.settings import LOGGER, config
+from netsec.modules.snapshot import get_store
+from netsec.modules.state import atomic_write
+
+_FIELDS = ((1, EventType.ip_changed), (2, EventType.name_changed),
+           (3, EventType.type_changed), (4, EventType.status_changed))
+
+
+class Event(NamedTuple):
+    """Change observed for a device between two consecutive scans."""
+
+    kind: EventType
+    record: Record
+    before: Optional[str] = None
+    after: Optional[str] = None
+
+
+class Tracker:
+    """Tracks the devices observed in the last scan, and reports the changes in every scan that follows.
+
+    >>> Tracker
+
+    See Also:
+        - Devices are keyed by MAC address, or by IP address for the devices that do not have one.
+        - Status covers ``allow_or_block`` for Netgear routers, and ``status`` for At&t routers.
+        - Type covers the connection type of the device.
+        - Devices that are not present in the snapshot remain open threats, and are checked again in every scan
+          until they leave, are blocked or are added to the snapshot.
+        - Every device in the scan is checked again when the snapshot is modified.
+        - The state is written to disk only when there are changes.
+    """
+
+    def __init__(self, filepath: str = None, persist: bool = True):
+        """Instantiates the tracker.
+
+        Args:
+            filepath: Path of the state file. Defaults to ``config.last_scan``
+            persist: Retains the last observed devices on disk, so that changes are reported across restarts.
+        """
+        self.filepath = filepath or config.last_scan
+        self.persist = persist
+        self._state: Optional[Dict[str, Tuple[Optional[str], ...]]] = None
+        self._threats: Set[str] = set()
+        self._baseline: Optional[List] = None
+
+    def _load(self) -> Dict[str, Tuple[Optional[str], ...]]:
+        """Loads the devices observed in the last scan, the open threats and the snapshot they were checked against."""
+        if self._state is None:
+            self._state = {}
+            if self.persist and os.path.isfile(self.filepath):
+                with open(self.filepath) as file:
+                    try:
+                        data = json.load(file)
+                    except ValueError as error:
+                        LOGGER.error("Failed to load %s: %s" % (self.filepath, error))
+                        data = {}
+                if "devices" not in data:  # legacy format, with only the devices
+                    data = dict(devices=data)
+                self._state = {key: tuple(value) for key, value in data["devices"].items()}
+                self._threats = set(data.get("threats", ()))
+                self._baseline = data.get("baseline")
+        return self._state
+
+    def devices(self) -> List[Record]:
+        """Returns the devices observed in the last scan."""
+        return [Record(*fields) for fields in self._load().values()]
+
+    def update(self, current: Inventory) -> List[Event]:
+        """Compares the current scan against the last one, and retains the current scan for the next comparison.
+
+        Args:
+            current: Inventory of the current scan.
+
+        Returns:
+            List[Event]:
+            Returns the devices that joined or left, and the changes in IP address, name, status or connection type.
+        """
+        previous = self._load()
+        state, events = {}, []
+        for record in current:
+            if not (key := record.mac or record.ip) or key in state:
+                continue
+            state[key] = fields = (record.mac, record.ip, record.name, record.type, record.status)
+            if (before := previous.get(key)) is None:
+                events.append(Event(kind=EventType.joined, record=record))
+            elif before != fields:
+                events.extend(Event(kind=kind, record=record, before=before[index], after=fields[index])
+                              for index, kind in _FIELDS if before[index] != fields[index])
+        events.extend(Event(kind=EventType.left, record=Record(*fields))
+                      for key, fields in previous.items() if key not in state)
+        self._state = state
+        if events:
+            LOGGER.info("Observed %d changes across %d devices." % (len(events), len(state)))
+            self.save()
+        return events
+
+    def unknown(self, current: Inventory, events: List[Event], baseline: Inventory) -> List[Record]:
+        """Collects the devices that are not present in the baseline, and retains the ones that remain a threat.
+
+        Args:
+            current: Inventory of the current scan.
+            events: Events reported by ``update`` for the current scan.
+            baseline: Inventory of the known devices.
+
+        See Also:
+            Only the devices that joined or changed, and the open threats are checked against the baseline.
+            Every device in the scan is checked when the snapshot was modified since the previous check.
+
+        Returns:
+            List[Record]:
+            Returns the records of the unknown devices, once per device.
+        """
+        self._load()
+        stamps = json.loads(json.dumps(get_store().stamps))  # tuples become lists, as they are when loaded
+        if stamps != self._baseline:
+            records = {id(record): record for record in current}
+        else:
+            records = {id(event.record): event.record for event in events if event.kind != EventType.left}
+            for key in self._threats:
+                record = current.by_mac(key) or current.by_ip(key)
+                if record and (record.mac or record.ip) == key:
+                    records[id(record)] = record
+        unknown = [record for record in records.values() if not baseline.match(record)]
+        threats = {record.mac or record.ip for record in unknown if record.status != DeviceStatus.block}
+        if threats != self._threats or stamps != self._baseline:
+            self._threats, self._baseline = threats, stamps
+            self.save()
+        return unknown
+
+    def save(self) -> NoReturn:
+        """Writes the devices observed in the last scan, and the open threats to disk."""
+        if not self.persist or self._state is None:
+            return
+        atomic_write(filepath=self.filepath, data=json.dumps(dict(devices=self._state, threats=sorted(self._threats),
+                                                                  baseline=self._baseline)))
+
+
+_TRACKERS: Dict[str, Tracker] = {}
+
+
+def get_tracker() -> Tracker:
+    """Returns the tracker for the current ``config.last_scan``, which is retained across scans."""
+    if config.last_scan not in _TRACKERS:
+        _TRACKERS[config.last_scan] = Tracker()
+    return _TRACKERS[config.last_scan]
@@ -0,0 +1,324 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import re
+import time
+from collections import deque
+from typing import (Any, Dict, List, NamedTuple, NoReturn, Optional, Sequence,
+                    Tuple)
+
+from netsec.modules.metrics import get_metrics
+from netsec.modules.models import SupportedModules, Target
+from netsec.modules.settings import LOGGER, Config, config
+
+# State files that are kept per site, the OUI index is shared by all the sites
+_STATE = ("snapshot", "snapshot_journal", "blocked", "blocked_yaml", "notification", "notification_queue",
+          "alert_state", "last_scan", "history", "telemetry")
+_SETTINGS = ("router_pass", "gmail_user", "gmail_pass", "recipient", "phone")
+_NAME = re.compile(r"^[\w.-]+$")
+
+
+class Site(NamedTuple):
+    """Site in the fleet, with the routers to be scanned and the settings that override the environment variables.
+
+    >>> Site
+
+    """
+
+    name: str
+    targets: Tuple[Target, ...]
+    block: bool = False
+    settings: Tuple[Tuple[str, str], ...] = ()
+
+
+class SiteResult(NamedTuple):
+    """Outcome of a scan for a single site.
+
+    >>> SiteResult
+
+    """
+
+    site: str
+    ok: bool
+    seconds: float
+    lag: float
+    devices: int = 0
+    threats: int = 0
+    stages: Dict[str, float] = {}
+    error: Optional[str] = None
+
+
+def _module(value: str) -> SupportedModules:
+    """Converts the name or value of a module, like ``netgear`` or ``Netgear``, into a SupportedModules object."""
+    for supported in SupportedModules:
+        if value in (supported.name, supported.value):
+            return supported
+    raise ValueError(
+        "\n\nmodule should be one of %s" % ", ".join("'%s'" % supported.value for supported in SupportedModules)
+    )
+
+
+def _resolve(entry: Dict[str, Any], key: str) -> Optional[str]:
+    """Reads a setting from the entry, or from the environment variable named by ``<key>_env``."""
+    if (variable := entry.get(key + "_env")) is not None:
+        if (value := os.environ.get(variable)) is None:
+            raise ValueError(
+                "\n\nenvironment variable '%s' is not set for '%s'" % (variable, entry.get("name", key))
+            )
+        return value
+    return entry.get(key)
+
+
+def load_sites(filepath: str) -> List[Site]:
+    """Loads the sites from a JSON inventory file.
+
+    Each site has a unique ``name`` and either a list of ``targets``, or the ``module``, ``host``, ``password``
+    and ``timeout`` of a single router. Passwords and the settings ``router_pass``, ``gmail_user``,
+    ``gmail_pass``, ``recipient`` and ``phone`` can be read from an environment variable with the ``_env`` suffix,
+    like ``"password_env": "STORE_1_ROUTER_PASS"``. Settings that are not set fall back to the environment variables.
+
+    Args:
+        filepath: Path of the inventory file.
+
+    Returns:
+        List[Site]:
+        Returns the sites in the order they are listed.
+    """
+    with open(filepath) as file:
+        entries = json.load(file)
+    if isinstance(entries, dict):
+        entries = entries.get("sites", [])
+    sites, names = [], set()
+    for entry in entries:
+        name = str(entry.get("name", ""))
+        if not _NAME.match(name) or name in names:
+            raise ValueError(
+                "\n\nsite name %r should be unique, and contain only letters, digits, '.', '_' and '-'" % name
+            )
+        names.add(name)
+        targets = tuple(Target(module=_module(target.get("module", "")), host=target.get("host"),
+                               password=_resolve(target, "password"), timeout=float(target.get("timeout", 30)))
+                        for target in entry.get("targets") or [entry])
+        settings = tuple((key, value) for key in _SETTINGS if (value := _resolve(entry, key)) is not None)
+        sites.append(Site(name=name, targets=targets, block=bool(entry.get("block", False)), settings=settings))
+    if not sites:
+        raise ValueError("\n\natleast one site is required in '%s'" % filepath)
+    return sites
+
+
+class _SiteFilter(logging.Filter):
+    """Prefixes the log messages with the name of the site, as the sites are logged together."""
+
+    def __init__(self, site: str):
+        super().__init__()
+        self.site = site
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Adds the prefix to the message."""
+        record.msg = "[%s] %s" % (self.site, record.msg)
+        return True
+
+
+def _configure(site: Site, directory: str) -> NoReturn:
+    """Points the state files to the site's directory, and applies the site's settings."""
+    for name in _STATE:
+        setattr(config, name, os.path.join(directory, site.name, os.path.basename(getattr(Config, name))))
+    for key, value in site.settings:
+        setattr(config, key, value)
+    LOGGER.addFilter(_SiteFilter(site=site.name))
+
+
+def _scan_site(site: Site, directory: str, init: bool, scheduled: float) -> SiteResult:
+    """Scans a site in a worker process, which is used for this site alone so that no state leaks across sites."""
+    from netsec.analyzer import multi_router_monitor
+    from netsec.modules.dispatcher import get_dispatcher
+    from netsec.modules.snapshot import get_store
+    from netsec.modules.telemetry import flush_telemetry
+
+    started = time.time()
+    _configure(site=site, directory=directory)
+    metrics = get_metrics()
+    metrics.enable()
+    error = None
+    try:
+        multi_router_monitor(targets=site.targets, init=init, block=site.block)
+    except Exception as exception:  # a failing site should not stop the rest of the fleet
+        LOGGER.error("Failed to scan: %s" % exception)
+        error = "%s: %s" % (type(exception).__name__, str(exception).strip())
+    finally:  # pool workers exit without running the atexit hooks
+        get_dispatcher().close()
+        flush_telemetry()
+    totals = metrics.totals()
+    if not error and (failures := int(totals.get("router_failures", 0))):
+        error = "%d of %d routers could not be scanned" % (failures, len(site.targets))
+    devices = len(get_store().inventory()) if init and not error else int(totals.get("devices_seen", 0))
+    return SiteResult(site=site.name, ok=error is None, seconds=time.time() - started, lag=max(started - scheduled, 0),
+                      devices=devices, threats=int(totals.get("threats", 0)),
+                      stages={key: value for key, value in totals.items() if key.endswith("_seconds")}, error=error)
+
+
+def _percentile(values: Sequence[float], fraction: float) -> float:
+    """Returns the value at the fraction of the sorted values, using the nearest rank."""
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] if ordered else 0
+
+
+def summarize(results: Sequence[SiteResult], seconds: float = None) -> Dict[str, Any]:
+    """Aggregates the results of a round of scans.
+
+    Args:
+        results: Results of each site.
+        seconds: Wall-clock time taken by the round.
+
+    Returns:
+        Dict[str, Any]:
+        Returns the number of sites, devices and threats, the failed sites, the distribution of scan times and lag,
+        and the time spent in each stage across all the sites.
+    """
+    durations = [result.seconds for result in results]
+    stages: Dict[str, float] = {}
+    for result in results:
+        for stage, value in result.stages.items():
+            stages[stage] = stages.get(stage, 0) + value
+    return dict(sites=len(results), seconds=seconds, devices=sum(result.devices for result in results),
+                threats=sum(result.threats for result in results),
+                failed=sorted(result.site for result in results if not result.ok),
+                p50=_percentile(durations, 0.5), p95=_percentile(durations, 0.95), max=max(durations, default=0),
+                max_lag=max((result.lag for result in results), default=0), stages=stages)
+
+
+class Fleet:
+    """Scans many sites from one host, using a pool of worker processes.
+
+    >>> Fleet
+
+    See Also:
+        - Every site has its own state directory under ``directory``, and its own settings.
+        - Every site is scanned in a fresh worker process, so that memory is returned and no state leaks across sites.
+        - Atmost ``max_workers`` sites are scanned at once, which bounds the CPU and memory used by the fleet.
+        - Start times are spread randomly across ``jitter`` seconds, so that the sites are not scanned in bursts.
+        - A site is handed to the pool only when a worker is free, so a slow round delays the remaining sites
+          instead of queueing them up. The delay is reported as ``lag`` in the results.
+    """
+
+    def __init__(self, sites: Sequence[Site], directory: str = "fleet", max_workers: int = None, jitter: float = 30):
+        """Validates the sites and starts the worker pool.
+
+        Args:
+            sites: Sites to be scanned.
+            directory: Directory under which the state of each site is stored.
+            max_workers: Maximum number of sites to scan at once. Defaults to the number of CPUs.
+            jitter: Number of seconds across which the start of the scans are spread.
+        """
+        if not sites:
+            raise ValueError("\n\natleast one site is required")
+        if len({site.name for site in sites}) != len(sites):
+            raise ValueError("\n\nsite names should be unique")
+        if jitter < 0:
+            raise ValueError("\n\n'jitter' should be a positive number")
+        self.sites = list(sites)
+        self.directory = directory
+        self.max_workers = max(min(max_workers or os.cpu_count() or 1, len(self.sites)), 1)
+        self.jitter = jitter
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["netsec.analyzer", "netsec.modules.scanner"])
+        else:
+            context = multiprocessing.get_context("spawn")
+        self._pool = context.Pool(processes=self.max_workers, maxtasksperchild=1)
+
+    def run_once(self, init: bool = False) -> List[SiteResult]:
+        """Scans every site once.
+
+        Args:
+            init: Creates the snapshot of every site, instead of scanning for threats.
+
+        Returns:
+            List[SiteResult]:
+            Returns the result of each site, in the order they completed.
+        """
+        metrics = get_metrics()
+        start, epoch = time.monotonic(), time.time()
+        schedule = deque(sorted(((random.uniform(0, self.jitter), site) for site in self.sites),
+                                key=lambda item: item[0]))
+        completed: queue.Queue = queue.Queue()
+        results, running = [], 0
+        while schedule or running:
+            timeout = None
+            if schedule and running < self.max_workers:
+                if (delay := start + schedule[0][0] - time.monotonic()) <= 0:
+                    offset, site = schedule.popleft()
+                    self._pool.apply_async(_scan_site, (site, self.directory, init, epoch + offset),
+                                           callback=completed.put,
+                                           error_callback=lambda error, name=site.name: completed.put(
+                                               SiteResult(site=name, ok=False, seconds=0, lag=0, error=repr(error))
+                                           ))
+                    running += 1
+                    continue
+                timeout = delay
+            try:
+                result = completed.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            running -= 1
+            results.append(result)
+            metrics.observe("site_seconds", result.seconds)
+            metrics.count("site_scans", result="ok" if result.ok else "failed")
+        summary = summarize(results=results, seconds=time.monotonic() - start)
+        LOGGER.info("Scanned %d sites in %.2fs, p95 %.2fs, max lag %.2fs, %d devices, %d threats, %d failed%s" %
+                    (summary['sites'], summary['seconds'], summary['p95'], summary['max_lag'], summary['devices'],
+                     summary['threats'], len(summary['failed']),
+                     ": %s" % ", ".join(summary['failed']) if summary['failed'] else ""))
+        return results
+
+    def run(self, interval: float = 300) -> NoReturn:
+        """Scans every site once every ``interval`` seconds.
+
+        Args:
+            interval: Number of seconds between the start of two rounds.
+        """
+        while True:
+            start = time.monotonic()
+            self.run_once()
+            if (remaining := start + interval - time.monotonic()) > 0:
+                time.sleep(remaining)
+            else:
+                LOGGER.warning("Round took %.2fs longer than the interval, consider raising 'max_workers'" %
+                               -remaining)
+
+    def close(self) -> NoReturn:
+        """Stops the worker pool, waiting for the ongoing scans."""
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self) -> "Fleet":
+        """Returns the fleet, to be closed when the context exits."""
+        return self
+
+    def __exit__(self, *args) -> NoReturn:
+        """Stops the worker pool."""
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="python -m netsec.modules.fleet",
+                                     description="Scans every site in a JSON inventory file, from one host.")
+    parser.add_argument("inventory", help="Path of the site inventory file.")
+    parser.add_argument("--directory", default="fleet", help="Directory under which the state of each site is stored.")
+    parser.add_argument("--workers", type=int, help="Maximum number of sites to scan at once.")
+    parser.add_argument("--jitter", type=float, default=30, help="Seconds across which the scans are spread.")
+    parser.add_argument("--interval", type=float, help="Seconds between two rounds. Scans once if not set.")
+    parser.add_argument("--init", action="store_true", help="Creates the snapshot of every site.")
+    args = parser.parse_args()
+    with Fleet(sites=load_sites(filepath=args.inventory), directory=args.directory,
+               max_workers=args.workers, jitter=args.jitter) as fleet:
+        if args.interval and not args.init:
+            fleet.run(interval=args.interval)
+        else:
+            begin = time.monotonic()
+            print(json.dumps(summarize(results=fleet.run_once(init=args.init), seconds=time.monotonic() - begin),
+                             indent=2))
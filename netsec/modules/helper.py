@@ -1,24 +1,16 @@
-import os
-import time
-from datetime import datetime
-from typing import Dict, List, NoReturn
-
-import gmailconnector as gc
-import jinja2
+from typing import Any, Callable, Dict, List, NoReturn, Optional
 
+from netsec.modules.events import get_tracker
+from netsec.modules.history import get_history
+from netsec.modules.inventory import Inventory, Record
+from netsec.modules.metrics import get_metrics
 from netsec.modules.settings import LOGGER, config
-
-
-def _log_response(response: gc.Response) -> NoReturn:
-    """Log response from gmail-connector."""
-    if response.ok:
-        LOGGER.info(response.body)
-        return True
-    LOGGER.error("Failed to send a notification.\n%s" % response.body)
+from netsec.modules.snapshot import get_baseline
+from netsec.modules.telemetry import Sample, score_devices
 
 
 def notify(msg_dict: List[Dict[str, str]]) -> NoReturn:
-    """Send an email notification when there is a threat.
+    """Queue a notification to be sent in the background, for the threats that weren't notified recently.
 
     Args:
         msg_dict: Dict message to be sent as template.
@@ -26,35 +18,63 @@ def notify(msg_dict: List[Dict[str, str]]) -> NoReturn:
     if not config.gmail_user and not config.gmail_pass and not (config.recipient or config.phone):
         LOGGER.info("Env variables not found to trigger notifications.")
         return
-    if os.path.isfile(config.notification):
-        with open(config.notification) as file:
-            try:
-                updated = float(file.read().strip())
-            except ValueError:
-                updated = None
-        if updated and time.time() - updated < 3_600:
-            LOGGER.info("Last notification was sent within an hour.")
-            return
-    msg_dict = [{key: value for key, value in sorted(d.items(), key=lambda item: len(item[0]))} for d in msg_dict]
-    sub = f"NetSec Alert - {datetime.now().strftime('%c')}"
-    if config.recipient:
-        with open(os.path.join(os.path.dirname(__file__), 'email_template.html')) as file:
-            template = jinja2.Template(file.read())
-        rendered = template.render(alerts=msg_dict)
-        emailer = gc.SendEmail(gmail_user=config.gmail_user, gmail_pass=config.gmail_pass)
-        response = emailer.send_email(recipient=config.recipient.email, sender="NetSec",
-                                      subject=sub, html_body=rendered)
-        if _log_response(response=response):
-            with open(config.notification, 'w') as file:
-                file.write(time.time().__str__())
-    if config.phone:
-        msg = ""
-        for part in msg_dict:
-            for key, value in part.items():
-                msg += "%s: %s\n" % (key, value)
-            msg += "\n"
-        messenger = gc.SendSMS(gmail_user=config.gmail_user, gmail_pass=config.gmail_pass)
-        response = messenger.send_sms(message=msg, subject=sub)
-        if _log_response(response=response):
-            with open(config.notification, 'w') as file:
-                file.write(time.time().__str__())
+    from netsec.modules.alerts import get_alert_state
+    from netsec.modules.dispatcher import get_dispatcher
+
+    if alerts := get_alert_state().filter(threats=msg_dict):
+        get_dispatcher().submit(alerts=alerts)
+    else:
+        LOGGER.info("Threats were notified already.")
+
+
+def process_scan(current: Inventory,
+                 backend: str,
+                 intruder: Callable[[Record], Optional[Dict[str, str]]],
+                 sample: Callable[[Record], Optional[Sample]] = None,
+                 block: Callable[[List[Record]], Any] = None) -> List[Record]:
+    """Runs the stages that follow the fetch of a scan, which are the same for every backend.
+
+    Args:
+        current: Devices found in the scan.
+        backend: Name of the backend, to label the metrics.
+        intruder: Returns the information to be notified for a device that is not present in the snapshot,
+            or ``None`` if the device is not a threat.
+        sample: Extracts the telemetry of a known device. Telemetry is not scored when not set.
+        block: Blocks internet access to the intruders. Intruders are not blocked when not set.
+
+    See Also:
+        - Appends the scan to the presence history.
+        - Reports the changes since the previous scan, and collects the devices that are not present in the snapshot.
+        - Scores the telemetry of the known devices, and notifies the threats and anomalies.
+
+    Returns:
+        List[Record]:
+        Returns the records of the intruders.
+    """
+    metrics = get_metrics()
+    baseline = get_baseline()
+    threats, intruders = [], []
+    metrics.count("devices_seen", len(current), backend=backend)
+    with metrics.time("persist", backend=backend):
+        get_history().append(records=current)
+    with metrics.time("diff", backend=backend):
+        tracker = get_tracker()
+        events = tracker.update(current=current)
+        unknown = tracker.unknown(current=current, events=events, baseline=baseline)
+    for record in unknown:
+        if info := intruder(record):
+            threats.append(info)
+            intruders.append(record)
+    metrics.count("threats", len(threats), backend=backend)
+    if sample:
+        samples = [telemetry for telemetry in map(sample, filter(baseline.match, current)) if telemetry]
+        threats.extend(score_devices(samples=samples, current=current, backend=backend))
+    if block and intruders:
+        with metrics.time("block", backend=backend):
+            block(intruders)
+    if threats:
+        with metrics.time("notify", backend=backend):
+            notify(msg_dict=threats)
+    else:
+        LOGGER.info('NetSec has completed. No threats found on your network.')
+    return intruders
@@ -0,0 +1,247 @@
+import os
+import socket
+import struct
+import time
+from datetime import datetime, timedelta, timezone
+from typing import (TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional,
+                    Tuple)
+
+from netsec.modules.inventory import Record
+from netsec.modules.settings import LOGGER, config
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# epoch (uint32), MAC address (6 bytes), IPv4 address (4 bytes)
+_RECORD = struct.Struct("<I6s4s")
+_DATE_FORMAT = "%Y-%m-%d"
+
+
+def _pack_mac(mac: Optional[str]) -> bytes:
+    """Packs a MAC address into 6 bytes, or null bytes when it is missing or malformed."""
+    try:
+        if mac and len(packed := bytes.fromhex(mac.replace(":", "").replace("-", ""))) == 6:
+            return packed
+    except ValueError:
+        pass
+    return bytes(6)
+
+
+def _pack_ip(ip: Optional[str]) -> bytes:
+    """Packs an IPv4 address into 4 bytes, or null bytes when it is missing or malformed."""
+    try:
+        return socket.inet_aton(ip) if ip else bytes(4)
+    except OSError:
+        return bytes(4)
+
+
+def _key(device: str) -> Tuple[str, bytes]:
+    """Returns the field and the packed value to look up a device, by MAC address or IPv4 address."""
+    field, key = ("ip", _pack_ip(device)) if "." in device else ("mac", _pack_mac(device))
+    if not any(key):
+        raise ValueError("\n\n'%s' is not a valid MAC address or IPv4 address" % device)
+    return field, key
+
+
+def _partition(epoch: float) -> str:
+    """Returns the name of the daily partition, in UTC, for a point in time."""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime(_DATE_FORMAT)
+
+
+class Presence(NamedTuple):
+    """Presence of a device across the scans in the history.
+
+    >>> Presence
+
+    """
+
+    device: str
+    first_seen: float
+    last_seen: float
+    sightings: int
+    uptime: float
+
+
+class History:
+    """Columnar presence history, that stores every scan as fixed-width records in daily partitions.
+
+    >>> History
+
+    See Also:
+        - Each device seen in a scan is stored as a 14-byte record, with the epoch, MAC address and IPv4 address.
+        - Records are appended to one file per day (UTC), named ``YYYY-MM-DD.bin``, with a single write per scan.
+        - Partitions are memory mapped and filtered with ``numpy`` when queried.
+        - Partitions older than ``retention`` days are removed by ``compact()``, which runs whenever a new day begins.
+    """
+
+    def __init__(self, directory: str = None, retention: int = 90):
+        """Instantiates the history.
+
+        Args:
+            directory: Directory to store the partitions. Defaults to ``config.history``
+            retention: Number of days for which the partitions are retained.
+        """
+        self.directory = directory or config.history
+        self.retention = retention
+        self._current: Optional[str] = None
+
+    def append(self, records: Iterable[Record], epoch: float = None) -> int:
+        """Appends the devices seen in a scan to the partition of the day.
+
+        Args:
+            records: Devices seen in the scan.
+            epoch: Time of the scan. Defaults to ``time.time()``
+
+        Returns:
+            int:
+            Returns the number of records written.
+        """
+        epoch = int(epoch or time.time())
+        data = b"".join(_RECORD.pack(epoch, _pack_mac(record.mac), _pack_ip(record.ip))
+                        for record in records if record.mac or record.ip)
+        if not data:
+            return 0
+        if (partition := _partition(epoch)) != self._current:
+            self._current = partition
+            self.compact(now=epoch)
+        os.makedirs(self.directory, exist_ok=True)
+        filepath = os.path.join(self.directory, partition + ".bin")
+        fd = os.open(filepath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if torn := (size := os.fstat(fd).st_size) % _RECORD.size:
+                # drop the partially written record of an interrupted scan, to keep the following records aligned
+                LOGGER.warning("Truncating %d bytes of a partially written record in %s" % (torn, filepath))
+                os.ftruncate(fd, size - torn)
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        return len(data) // _RECORD.size
+
+    def partitions(self) -> List[Tuple[str, str]]:
+        """Lists the partitions in chronological order.
+
+        Returns:
+            List[Tuple[str, str]]:
+            Returns the date and the path of each partition.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name[:-4], os.path.join(self.directory, name))
+                      for name in os.listdir(self.directory) if name.endswith(".bin"))
+
+    @staticmethod
+    def _read(filepath: str) -> "np.ndarray":
+        """Memory maps a partition, ignoring a partially written record at the end."""
+        import numpy as np
+
+        dtype = np.dtype([("epoch", "<u4"), ("mac", "S6"), ("ip", "S4")])
+        if not (count := os.path.getsize(filepath) // dtype.itemsize):
+            return np.empty(0, dtype=dtype)
+        return np.memmap(filepath, dtype=dtype, mode='r', shape=(count,))
+
+    def sightings(self, device: str, since: float = None, until: float = None) -> "np.ndarray":
+        """Collects the times at which a device was seen.
+
+        Args:
+            device: MAC address or IPv4 address of the device.
+            since: Start of the time range. Defaults to the oldest partition.
+            until: End of the time range. Defaults to the latest partition.
+
+        Returns:
+            np.ndarray:
+            Returns the epochs of the scans in which the device was seen, in ascending order.
+        """
+        import numpy as np
+
+        field, key = _key(device=device)
+        first = _partition(since) if since else ""
+        last = _partition(until) if until else "9999"
+        epochs = []
+        for date, filepath in self.partitions():
+            if not first <= date <= last:
+                continue
+            data = self._read(filepath=filepath)
+            mask = data[field] == key
+            if since:
+                mask &= data["epoch"] >= since
+            if until:
+                mask &= data["epoch"] <= until
+            epochs.append(data["epoch"][mask])
+        if not epochs:
+            return np.empty(0, dtype="<u4")
+        return np.unique(np.concatenate(epochs))
+
+    def presence(self, device: str, max_gap: float = 600,
+                 since: float = None, until: float = None) -> Optional[Presence]:
+        """Summarizes the presence of a device.
+
+        Args:
+            device: MAC address or IPv4 address of the device.
+            max_gap: Maximum number of seconds between two sightings, for the device to be considered connected
+                throughout. Should be more than the scan interval.
+            since: Start of the time range. Defaults to the oldest partition.
+            until: End of the time range. Defaults to the latest partition.
+
+        Returns:
+            Presence:
+            Returns the first and last time the device was seen, the number of scans it was seen in and its uptime
+            in seconds. Returns ``None`` if the device was never seen.
+        """
+        import numpy as np
+
+        epochs = self.sightings(device=device, since=since, until=until)
+        if not len(epochs):
+            return
+        gaps = np.diff(epochs.astype("<i8"))
+        return Presence(device=device, first_seen=float(epochs[0]), last_seen=float(epochs[-1]),
+                        sightings=len(epochs), uptime=float(gaps[gaps <= max_gap].sum()))
+
+    def _find(self, filepath: str, device: str) -> "np.ndarray":
+        """Collects the times at which a device was seen, within a single partition."""
+        field, key = _key(device=device)
+        data = self._read(filepath=filepath)
+        return data["epoch"][data[field] == key]
+
+    def first_seen(self, device: str) -> Optional[float]:
+        """Returns the first time a device was seen, reading upto the oldest partition that has a sighting of it."""
+        for _, filepath in self.partitions():
+            if len(epochs := self._find(filepath=filepath, device=device)):
+                return float(epochs.min())
+
+    def last_seen(self, device: str) -> Optional[float]:
+        """Returns the last time a device was seen, reading upto the latest partition that has a sighting of it."""
+        for _, filepath in reversed(self.partitions()):
+            if len(epochs := self._find(filepath=filepath, device=device)):
+                return float(epochs.max())
+
+    def compact(self, now: float = None) -> int:
+        """Removes the partitions that are older than the retention period.
+
+        Args:
+            now: Current time. Defaults to ``time.time()``
+
+        Returns:
+            int:
+            Returns the number of partitions removed.
+        """
+        cutoff = _partition((now or time.time()) - timedelta(days=self.retention).total_seconds())
+        removed = 0
+        for date, filepath in self.partitions():
+            if date >= cutoff:
+                break
+            os.remove(filepath)
+            removed += 1
+        if removed:
+            LOGGER.info("Removed %d partitions from %s, that were older than %d days." %
+                        (removed, self.directory, self.retention))
+        return removed
+
+
+_HISTORIES: Dict[str, History] = {}
+
+
+def get_history() -> History:
+    """Returns the presence history for the current ``config.history``, which is retained across scans."""
+    if config.history not in _HISTORIES:
+        _HISTORIES[config.history] = History()
+    return _HISTORIES[config.history]
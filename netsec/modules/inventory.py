@@ -0,0 +1,146 @@
+from collections.abc import Generator, Iterable
+from typing import Any, Dict, List, Optional
+
+
+class Record:
+    """Compact device record shared across all the modules.
+
+    >>> Record
+
+    """
+
+    __slots__ = ("mac", "ip", "name", "type", "status", "device")
+
+    def __init__(self,
+                 mac: Optional[str] = None,
+                 ip: Optional[str] = None,
+                 name: Optional[str] = None,
+                 type: Optional[str] = None,
+                 status: Optional[str] = None,
+                 device: Any = None):
+        """Instantiates the record with the device information.
+
+        Args:
+            mac: MAC address of the device.
+            ip: IP address of the device.
+            name: Name of the device.
+            type: Connection type of the device.
+            status: Allow or block status of the device.
+            device: Source object the record was created from, as returned by the router.
+        """
+        self.mac = mac.upper() if mac else None
+        self.ip = ip
+        self.name = name
+        self.type = type
+        self.status = status
+        self.device = device
+
+    def __repr__(self) -> str:
+        """Representation of the record."""
+        return "Record(name=%r, ip=%r, mac=%r)" % (self.name, self.ip, self.mac)
+
+    @property
+    def vendor(self) -> Optional[str]:
+        """Vendor of the device, looked up from the prefix of its MAC address."""
+        from netsec.modules.oui import get_index
+
+        return get_index().lookup(self.mac)
+
+    @property
+    def randomized(self) -> bool:
+        """Whether the MAC address is randomized, in which case the vendor cannot be looked up."""
+        from netsec.modules.oui import is_randomized
+
+        return is_randomized(self.mac)
+
+
+class Inventory:
+    """Collection of device records, indexed by IP address, MAC address and name.
+
+    >>> Inventory
+
+    """
+
+    __slots__ = ("_by_ip", "_by_mac", "_by_name", "_positions", "_records")
+
+    def __init__(self, records: Iterable[Record] = ()):
+        """Indexes the records.
+
+        Args:
+            records: Takes an iterable of Record objects as an argument.
+        """
+        self._records: List[Record] = []
+        self._positions: Dict[str, int] = {}
+        self._by_ip: Dict[str, Record] = {}
+        self._by_mac: Dict[str, Record] = {}
+        self._by_name: Dict[str, Record] = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record: Record) -> None:
+        """Adds a record to the inventory, replacing the existing record with the same key in place.
+
+        Args:
+            record: Takes a Record object as an argument.
+
+        See Also:
+            Records are keyed by MAC address, or by IP address for the records that do not have one.
+        """
+        if (key := record.mac or record.ip) in self._positions:
+            position = self._positions[key]
+            existing, self._records[position] = self._records[position], record
+            for index, value in ((self._by_ip, existing.ip), (self._by_mac, existing.mac),
+                                 (self._by_name, existing.name)):
+                if value and index.get(value) is existing:
+                    del index[value]
+        else:
+            if key:
+                self._positions[key] = len(self._records)
+            self._records.append(record)
+        if record.ip:
+            self._by_ip[record.ip] = record
+        if record.mac:
+            self._by_mac[record.mac] = record
+        if record.name:
+            self._by_name[record.name] = record
+
+    def by_ip(self, ip: str) -> Optional[Record]:
+        """Looks up a record by IP address."""
+        return self._by_ip.get(ip)
+
+    def by_mac(self, mac: str) -> Optional[Record]:
+        """Looks up a record by MAC address."""
+        return self._by_mac.get(mac.upper()) if mac else None
+
+    def by_name(self, name: str) -> Optional[Record]:
+        """Looks up a record by device name."""
+        return self._by_name.get(name)
+
+    def match(self, record: Record) -> Optional[Record]:
+        """Finds the record for the same device, by MAC address or by IP address when either of them has no MAC address.
+
+        Args:
+            record: Takes a Record object as an argument.
+
+        Returns:
+            Record:
+            Returns the matching Record object from the inventory.
+        """
+        if record.mac and (found := self._by_mac.get(record.mac)):
+            return found
+        if record.ip and (found := self._by_ip.get(record.ip)) and not (found.mac and record.mac):
+            return found
+
+    def __contains__(self, record: Record) -> bool:
+        """Checks if a record with the same MAC address or IP address is present in the inventory."""
+        if record.mac:
+            return record.mac in self._by_mac
+        return record.ip in self._by_ip
+
+    def __iter__(self) -> Generator[Record]:
+        """Iterates over the records in the order they were added."""
+        yield from self._records
+
+    def __len__(self) -> int:
+        """Number of records in the inventory."""
+        return len(self._records)
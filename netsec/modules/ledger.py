@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Generator
+from typing import Any, Dict, NoReturn
+
+from netsec.modules.settings import LOGGER, config, make_dirs
+
+
+class BlockLedger:
+    """Ledger of blocked devices, stored in a SQLite database indexed by MAC address.
+
+    >>> BlockLedger
+
+    """
+
+    def __init__(self, filepath: str = None):
+        """Opens the ledger, and migrates the entries from ``blocked.yaml`` if the ledger is being created.
+
+        Args:
+            filepath: Path of the database file. Defaults to ``config.blocked``
+        """
+        self.filepath = filepath or config.blocked
+        self._lock = threading.Lock()
+        make_dirs(filepath=self.filepath)
+        self._connection = sqlite3.connect(self.filepath, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS blocked "
+            "(mac TEXT PRIMARY KEY, epoch REAL NOT NULL, name TEXT, ip TEXT, info TEXT NOT NULL)"
+        )
+        if os.path.isfile(config.blocked_yaml) and not len(self):
+            self.migrate(filepath=config.blocked_yaml)
+
+    def add(self, device_info: Dict[str, Any], epoch: float = None) -> NoReturn:
+        """Adds a device to the ledger, replacing any existing entry for the same MAC address.
+
+        Args:
+            device_info: Device information as a dictionary, that includes the ``mac`` key.
+            epoch: Time when the device was blocked. Defaults to current time.
+        """
+        if not device_info.get('mac'):
+            raise ValueError("\n\n'mac' is required to add a device to the ledger")
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO blocked (mac, epoch, name, ip, info) VALUES (?, ?, ?, ?, ?)",
+                (device_info['mac'].upper(), epoch or time.time(), device_info.get('name'), device_info.get('ip'),
+                 json.dumps(device_info, default=str))
+            )
+
+    def remove(self, mac: str) -> bool:
+        """Removes a device from the ledger.
+
+        Args:
+            mac: MAC address of the device.
+
+        Returns:
+            bool:
+            Returns a boolean flag to indicate whether the device was present in the ledger.
+        """
+        with self._lock:
+            cursor = self._connection.execute("DELETE FROM blocked WHERE mac = ?", (mac.upper(),))
+        return bool(cursor.rowcount)
+
+    def get(self, mac: str) -> Dict[str, Any]:
+        """Gets the stored information of a blocked device.
+
+        Args:
+            mac: MAC address of the device.
+
+        Returns:
+            Dict[str, Any]:
+            Returns the device information as a dictionary, or an empty dictionary if the device is not blocked.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT info FROM blocked WHERE mac = ?", (mac.upper(),)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def __contains__(self, mac: str) -> bool:
+        """Checks if a device is present in the ledger."""
+        if not mac:
+            return False
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM blocked WHERE mac = ?", (mac.upper(),)).fetchone()
+        return row is not None
+
+    def __iter__(self) -> Generator[Dict[str, Any]]:
+        """Iterates over the blocked devices, in the order they were blocked."""
+        with self._lock:
+            rows = self._connection.execute("SELECT epoch, info FROM blocked ORDER BY epoch").fetchall()
+        for epoch, info in rows:
+            yield dict(json.loads(info), epoch=epoch)
+
+    def __len__(self) -> int:
+        """Number of devices in the ledger."""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM blocked").fetchone()[0]
+
+    def migrate(self, filepath: str) -> NoReturn:
+        """Imports the entries from a ``blocked.yaml`` file, and renames the file once migrated.
+
+        Args:
+            filepath: Path of the YAML file.
+        """
+        import yaml
+
+        with open(filepath) as file:
+            try:
+                blocked_devices = yaml.load(stream=file, Loader=yaml.FullLoader) or {}
+            except yaml.YAMLError as error:
+                LOGGER.error(error)
+                return
+        for epoch, device_info in blocked_devices.items():
+            if isinstance(device_info, dict) and device_info.get('mac'):
+                self.add(device_info=device_info, epoch=float(epoch))
+        os.rename(filepath, filepath + ".migrated")
+        LOGGER.info("Migrated %d entries from %s to %s" % (len(blocked_devices), filepath, self.filepath))
+
+    def close(self) -> NoReturn:
+        """Closes the connection to the database."""
+        self._connection.close()
+
+
+_LEDGERS: Dict[str, BlockLedger] = {}
+
+
+def get_ledger() -> BlockLedger:
+    """Returns the block ledger for the current ``config.blocked``, which retains the connection across scans."""
+    if config.blocked not in _LEDGERS:
+        _LEDGERS[config.blocked] = BlockLedger()
+    return _LEDGERS[config.blocked]
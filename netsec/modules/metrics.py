@@ -0,0 +1,239 @@
+import contextlib
+import functools
+import json
+import threading
+import time
+from collections.abc import Generator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, NoReturn, Optional, Tuple
+
+from netsec.modules.settings import LOGGER
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_Labels = Tuple[Tuple[str, str], ...]
+_DISABLED = contextlib.nullcontext()
+
+
+class _Histogram:
+    """Cumulative histogram of observations, with a sum and a count."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> NoReturn:
+        """Adds an observation to the buckets it falls in."""
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format(name: str, labels: _Labels, value: float) -> str:
+    """Formats a sample in the Prometheus text format."""
+    if labels:
+        return '%s{%s} %s' % (name, ",".join('%s="%s"' % label for label in labels), repr(float(value)))
+    return "%s %s" % (name, repr(float(value)))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the metrics held by the server."""
+
+    def do_GET(self) -> None:
+        """Responds with the metrics in the Prometheus text format."""
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        """Suppresses the access logs."""
+
+
+class Metrics:
+    """Timers and counters for the stages of a scan, that cost nothing more than a flag check while disabled.
+
+    >>> Metrics
+
+    See Also:
+        - Stages are timed as the ``netsec_stage_seconds`` histogram, labelled by ``stage`` and ``backend``
+        - Counters are exported with a ``_total`` suffix, like ``netsec_devices_seen_total``
+        - Metrics are served in the Prometheus text format at ``/metrics``, and/or logged as JSON lines.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.json_log = False
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[_Labels, float]] = {}
+        self._histograms: Dict[str, Dict[_Labels, _Histogram]] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def enable(self, port: int = None, host: str = "127.0.0.1", json_log: bool = False) -> NoReturn:
+        """Starts collecting metrics.
+
+        Args:
+            port: Port to serve the metrics on. Metrics are not served over HTTP by default.
+            host: Interface to serve the metrics on.
+            json_log: Logs every observation as a JSON line.
+        """
+        self.enabled = True
+        self.json_log = json_log
+        if port is not None and not self._server:
+            self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            self._server.daemon_threads = True
+            self._server.metrics = self
+            threading.Thread(target=self._server.serve_forever, name="netsec-metrics", daemon=True).start()
+            LOGGER.info("Serving metrics on http://%s:%d/metrics" % (host, self._server.server_port))
+
+    def disable(self) -> NoReturn:
+        """Stops collecting metrics, and stops serving them."""
+        self.enabled = False
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _log(self, metric: str, value: float, labels: _Labels) -> NoReturn:
+        """Logs an observation as a JSON line."""
+        LOGGER.info(json.dumps(dict(labels, metric=metric, value=value)))
+
+    def count(self, name: str, value: float = 1, **labels: str) -> NoReturn:
+        """Increments a counter.
+
+        Args:
+            name: Name of the counter, without the ``_total`` suffix.
+            value: Amount to increment by.
+            labels: Labels of the counter.
+        """
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        if self.json_log:
+            self._log(metric=name, value=value, labels=key)
+
+    def observe(self, name: str, value: float, **labels: str) -> NoReturn:
+        """Records an observation in a histogram.
+
+        Args:
+            name: Name of the histogram.
+            value: Observed value.
+            labels: Labels of the histogram.
+        """
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = _Histogram()
+            series[key].observe(value)
+        if self.json_log:
+            self._log(metric=name, value=value, labels=key)
+
+    def time(self, stage: str, **labels: str) -> contextlib.AbstractContextManager:
+        """Times a stage of a scan.
+
+        Args:
+            stage: Name of the stage, like ``fetch``, ``parse``, ``diff``, ``persist`` or ``notify``
+            labels: Additional labels, like ``backend``
+
+        Returns:
+            contextlib.AbstractContextManager:
+            Returns a context manager, that records the time spent within it.
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._time(stage=stage, **labels)
+
+    @contextlib.contextmanager
+    def _time(self, stage: str, **labels: str) -> Generator[None]:
+        """Records the time spent within the context, including the time until an error was raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def totals(self) -> Dict[str, float]:
+        """Sums up the counters and the time spent in each stage, across all labels.
+
+        Returns:
+            Dict[str, float]:
+            Returns the counters by name, and the stage timings as ``<stage>_seconds``
+        """
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for name, series in self._counters.items():
+                totals[name] = sum(series.values())
+            for labels, histogram in self._histograms.get("stage_seconds", {}).items():
+                key = "%s_seconds" % dict(labels).get("stage")
+                totals[key] = totals.get(key, 0) + histogram.sum
+        return totals
+
+    def render(self) -> str:
+        """Renders the metrics in the Prometheus text format.
+
+        Returns:
+            str:
+            Returns the metrics, one sample per line.
+        """
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append("# TYPE netsec_%s_total counter" % name)
+                lines.extend(_format("netsec_%s_total" % name, labels, value) for labels, value in series.items())
+            for name, series in sorted(self._histograms.items()):
+                lines.append("# TYPE netsec_%s histogram" % name)
+                for labels, histogram in series.items():
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        lines.append(_format("netsec_%s_bucket" % name, labels + (("le", str(bound)),), count))
+                    lines.append(_format("netsec_%s_bucket" % name, labels + (("le", "+Inf"),), histogram.count))
+                    lines.append(_format("netsec_%s_sum" % name, labels, histogram.sum))
+                    lines.append(_format("netsec_%s_count" % name, labels, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+_METRICS = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Returns the metrics of the current process."""
+    return _METRICS
+
+
+def timed(stage: str, **labels: str) -> Callable:
+    """Decorator to time a function as a stage of a scan.
+
+    Args:
+        stage: Name of the stage.
+        labels: Additional labels, like ``backend``
+
+    Returns:
+        Callable:
+        Returns the decorator.
+    """
+    def decorator(function: Callable) -> Callable:
+        """Wraps the function with a timer."""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            """Times the function, when metrics are enabled."""
+            if not _METRICS.enabled:
+                return function(*args, **kwargs)
+            with _METRICS.time(stage, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
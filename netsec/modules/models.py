@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import NamedTuple, Optional
 
 
 class DeviceStatus(str, Enum):
@@ -9,7 +10,45 @@ class DeviceStatus(str, Enum):
 
 
 class SupportedModules(str, Enum):
-    """Supported modules are At&t and Netgear."""
+    """Supported modules are At&t, Netgear and an ARP sweep of the local subnet."""
 
     att: str = "At&t"
     netgear: str = "Netgear"
+    arp: str = "ARP"
+
+
+class EventType(str, Enum):
+    """Changes observed for a device between two consecutive scans."""
+
+    joined: str = "joined"
+    left: str = "left"
+    ip_changed: str = "ip_changed"
+    name_changed: str = "name_changed"
+    status_changed: str = "status_changed"
+    type_changed: str = "type_changed"
+
+
+class Target(NamedTuple):
+    """Router to be scanned, when scanning multiple routers at once.
+
+    >>> Target
+
+    """
+
+    module: SupportedModules
+    host: Optional[str] = None
+    password: Optional[str] = None
+    timeout: float = 30
+
+
+class CacheInfo(NamedTuple):
+    """Usage statistics of the device-list cache of a Netgear router.
+
+    >>> CacheInfo
+
+    """
+
+    hits: int
+    misses: int
+    ttl: float
+    age: Optional[float]
@@ -1,15 +1,19 @@
-import copy
-import json
-import os
 import time
-from typing import NoReturn, Union
+from typing import Dict, Iterable, List, NoReturn, Optional, Tuple, Union
 
-import yaml
 from pynetgear import Device, Netgear
-
-from netsec.modules.helper import notify
-from netsec.modules.models import DeviceStatus
+from pynetgear.const import SERVICE_DEVICE_CONFIG
+
+from netsec.modules.alerts import get_alert_state
+from netsec.modules.helper import process_scan
+from netsec.modules.inventory import Inventory, Record
+from netsec.modules.ledger import BlockLedger, get_ledger
+from netsec.modules.metrics import get_metrics, timed
+from netsec.modules.models import CacheInfo, DeviceStatus
+from netsec.modules.oui import vendor_info
 from netsec.modules.settings import LOGGER, config
+from netsec.modules.snapshot import get_store
+from netsec.modules.telemetry import Sample, to_number
 
 
 class LocalIPScan:
@@ -17,65 +21,185 @@ class LocalIPScan:
 
     >>> LocalIPScan
 
+    See Also:
+        - The list of devices is cached for ``ttl`` seconds, and shared across the operations on the same object.
+        - Scans always fetch a fresh list, which is then re-used by the allow and block operations that follow.
+        - The cache is invalidated whenever a device is allowed or blocked.
     """
 
-    def __init__(self):
-        """Gets local host devices connected to the same network range."""
-        self.netgear = Netgear(password=config.router_pass)
+    def __init__(self, host: str = None, password: str = None, ttl: float = 30, detailed: bool = False):
+        """Gets local host devices connected to the same network range.
 
-    def _get_devices(self) -> Device:
+        Args:
+            host: Hostname or IP address of the router. Defaults to auto discovery.
+            password: Password for the router. Defaults to ``config.router_pass``
+            ttl: Number of seconds for which the list of devices is re-used. Set to 0 to disable caching.
+            detailed: Uses ``get_attached_devices_2`` to include the model, SSID and access point of each device.
+        """
+        self.password = password or config.router_pass
+        self.netgear = Netgear(password=self.password, host=host)
+        self.ttl = ttl
+        self.detailed = detailed
+        self._cache: Optional[Tuple[float, List[Device]]] = None
+        self._validated = False
+        self._hits = 0
+        self._misses = 0
+
+    def _get_devices(self, fresh: bool = False) -> List[Device]:
         """Scans the Netgear router for connected devices and the devices' information.
 
+        Args:
+            fresh: Fetches the list from the router, even if a cached list is available.
+
         Returns:
-            Device:
+            List[Device]:
             Returns list of devices connected to the router and the connection information.
+
+        See Also:
+            Raises ``ValueError`` if the router never listed the devices, as the password is likely to be invalid,
+            and ``ConnectionError`` if it has listed them before.
         """
+        if not fresh and self._cache and time.monotonic() - self._cache[0] < self.ttl:
+            self._hits += 1
+            get_metrics().count("device_list_cache", result="hit")
+            return self._cache[1]
+        self._misses += 1
+        get_metrics().count("device_list_cache", result="miss")
         LOGGER.info('Getting devices connected to your network.')
-        if devices := self.netgear.get_attached_devices():
+        devices = None
+        with get_metrics().time("fetch", backend="netgear"):
+            if self.detailed:
+                if not (devices := self.netgear.get_attached_devices_2()):
+                    LOGGER.warning("Failed to get detailed information of the devices, "
+                                   "falling back to basic information.")
+            devices = devices or self.netgear.get_attached_devices()
+        if devices:
+            self._cache = (time.monotonic(), devices)
+            self._validated = True
             return devices
+        elif self._validated:  # the password was accepted before, so this is a transient failure of the router
+            raise ConnectionError("Failed to get the devices connected to the netgear router.")
         else:
-            text = "'router_pass' is invalid" if config.router_pass else "'router_pass' is required for netgear network"
+            text = "'router_pass' is invalid" if self.password else "'router_pass' is required for netgear network"
             raise ValueError("\n\n" + text)
 
+    def invalidate(self) -> NoReturn:
+        """Discards the cached list of devices, so that the next lookup fetches it from the router."""
+        self._cache = None
+
+    def cache_info(self) -> CacheInfo:
+        """Returns the usage statistics of the device-list cache.
+
+        Returns:
+            CacheInfo:
+            Returns the number of hits and misses, the ttl and the age of the cached list in seconds.
+        """
+        return CacheInfo(hits=self._hits, misses=self._misses, ttl=self.ttl,
+                         age=time.monotonic() - self._cache[0] if self._cache else None)
+
     def create_snapshot(self) -> NoReturn:
         """Creates a snapshot.json which is used to determine the known and unknown devices."""
         LOGGER.warning("Creating a snapshot will capture the current list of devices connected to your network at"
                        " this moment.")
         LOGGER.warning("This capture will be used to alert/block when new devices are connected. So, please review "
                        "the '%s' manually and remove the devices that aren't recognized." % config.snapshot)
-        devices = {}
-        for device in self._get_devices():
-            if device.ip:  # Only look for currently connected devices
-                devices[device.ip] = [device.name, device.type, device.allow_or_block]
-        LOGGER.info('Number of devices connected: %d' % len(devices.keys()))
-        with open(config.snapshot, 'w') as file:
-            json.dump(devices, file, indent=2)
+        devices = Inventory(Record(mac=device.mac, ip=device.ip, name=device.name, type=device.type,
+                                   status=device.allow_or_block)
+                            for device in self._get_devices(fresh=True) if device.ip)  # Only look for connected devices
+        LOGGER.info('Number of devices connected: %d' % len(devices))
+        get_store().save(records=devices)
 
-    def _get_device_by_name(self, name: str) -> Device:
-        """Calls the ``get_devices()`` method and checks if the given device is available in the list.
+    def _resolve(self, devices: Iterable[Union[str, Device]]) -> List[Tuple[str, Optional[Device]]]:
+        """Resolves device names into Device objects, using a single listing of the devices from the router.
 
         Args:
-            name: Takes device name as argument.
+            devices: Takes an iterable of device names or Device objects as an argument.
 
         Returns:
-            Device:
-            Returns device information as a Device object.
-        """
-        for device in self._get_devices():
-            if device.name == name:
-                return device
-
-    def _get_device_obj(self, device: str):
-        """Identify device object using the device name as a string."""
-        if isinstance(device, str):
-            tmp = device
-            LOGGER.info('Looking information on %s' % device)
-            if device := self._get_device_by_name(name=device):
-                return device
+            List[Tuple[str, Optional[Device]]]:
+            Returns the device name or MAC address as given, along with the resolved Device object.
+        """
+        devices = list(devices)
+        listing = Inventory()
+        if any(isinstance(device, str) for device in devices):
+            listing = Inventory(self.to_record(device=device) for device in self._get_devices())
+        resolved = []
+        for device in devices:
+            if isinstance(device, str):
+                if not (found := listing.by_name(device)):
+                    LOGGER.error('Device: %s is not connected to your network.' % device)
+                resolved.append((device, found.device if found else None))
             else:
-                LOGGER.error('Device: %s is not connected to your network.' % tmp)
-        else:
-            return device
+                resolved.append((device.mac, device))
+        return resolved
+
+    def _set_status(self, devices: Iterable[Union[str, Device]],
+                    status: DeviceStatus) -> List[Tuple[str, Optional[Device], bool]]:
+        """Allows or blocks the devices, by pipelining the requests within a single configuration session.
+
+        Args:
+            devices: Takes an iterable of device names or Device objects as an argument.
+            status: Status to be set for the devices.
+
+        Returns:
+            List[Tuple[str, Optional[Device], bool]]:
+            Returns the device name or MAC address as given, the resolved Device object and the result of the call.
+            Every result is ``False`` if the router does not confirm the changes when the session is finished.
+        """
+        results = []
+        resolved = self._resolve(devices=devices)
+        if not any(device for _, device in resolved):
+            return [(key, device, False) for key, device in resolved]
+        if not self.netgear.config_start():
+            LOGGER.error("Could not start configuration session on the router.")
+            return [(key, device, False) for key, device in resolved]
+        try:
+            for key, device in resolved:
+                if not device:
+                    results.append((key, device, False))
+                    continue
+                LOGGER.info("%s internet access to '%s'" % ("Granting" if status == DeviceStatus.allow else "Blocking",
+                                                            device.name))
+                # noinspection PyProtectedMember
+                success, _ = self.netgear._make_request(
+                    SERVICE_DEVICE_CONFIG, "SetBlockDeviceByMAC",
+                    {"NewAllowOrBlock": status.value, "NewMACAddress": device.mac}
+                )
+                get_metrics().count("block_calls", action=status.name, result="ok" if success else "failed")
+                if not success:
+                    LOGGER.error("Failed to set status to %s for '%s'" % (status.value, device.name))
+                results.append((key, device, success))
+        finally:
+            finished = self.netgear.config_finish()
+            self.invalidate()
+        if not finished:  # the router discards the changes of a session that it could not apply
+            LOGGER.error("Could not apply the changes on the router.")
+            return [(key, device, False) for key, device, _ in results]
+        return results
+
+    def allow_many(self, devices: Iterable[Union[str, Device]]) -> Dict[str, bool]:
+        """Allows internet access to multiple devices, with a single listing of devices and configuration session.
+
+        Args:
+            devices: Takes an iterable of device names or Device objects as an argument.
+
+        Returns:
+            Dict[str, bool]:
+            Returns the result per device, keyed by name for device names and by MAC address for Device objects.
+        """
+        return {key: success for key, _, success in self._set_status(devices=devices, status=DeviceStatus.allow)}
+
+    def block_many(self, devices: Iterable[Union[str, Device]]) -> Dict[str, bool]:
+        """Blocks internet access to multiple devices, with a single listing of devices and configuration session.
+
+        Args:
+            devices: Takes an iterable of device names or Device objects as an argument.
+
+        Returns:
+            Dict[str, bool]:
+            Returns the result per device, keyed by name for device names and by MAC address for Device objects.
+        """
+        return {key: success for key, _, success in self._set_status(devices=devices, status=DeviceStatus.block)}
 
     def allow(self, device: Union[str, Device]) -> Union[Device, None]:
         """Allows internet access to a device.
@@ -85,12 +209,10 @@ class LocalIPScan:
 
         Returns:
             Device:
-            Returns the device object received from ``get_device_by_name()`` method.
+            Returns the Device object that was allowed, or ``None`` if the device is not connected.
         """
-        if device := self._get_device_obj(device=device):
-            LOGGER.info("Granting internet access to '%s'" % device.name)
-            self.netgear.allow_block_device(mac_addr=device.mac, device_status=DeviceStatus.allow)
-            return device
+        [(_, device, _)] = self._set_status(devices=[device], status=DeviceStatus.allow)
+        return device
 
     def block(self, device: Union[str, Device]) -> Union[Device, None]:
         """Blocks internet access to a device.
@@ -100,43 +222,27 @@ class LocalIPScan:
 
         Returns:
             Device:
-            Returns the device object received from ``get_device_by_name()`` method.
+            Returns the Device object that was blocked, or ``None`` if the device is not connected.
         """
-        device = self._get_device_obj(device=device)
-        LOGGER.info("Blocking internet access to '%s'" % device.name)
-        self.netgear.allow_block_device(mac_addr=device.mac, device_status=DeviceStatus.block)
+        [(_, device, _)] = self._set_status(devices=[device], status=DeviceStatus.block)
         return device
 
     @staticmethod
     def _dump_blocked(device: Device) -> NoReturn:
-        """Converts device object to a dictionary and dumps it into ``blocked.json`` file.
+        """Converts device object to a dictionary and stores it in the block ledger.
 
         Args:
             device: Takes Device object as an argument.
         """
         LOGGER.info("Details of '%s' has been stored in %s" % (device.name, config.blocked))
-        with open(config.blocked, 'a') as file:
-            # noinspection PyProtectedMember
-            dictionary = {time.time(): device._asdict()}
-            yaml.dump(dictionary, file, allow_unicode=True, default_flow_style=False, sort_keys=False)
-
-    @staticmethod
-    def _get_blocked():
-        if os.path.isfile(config.blocked):
-            with open(config.blocked) as file:
-                try:
-                    blocked_devices = yaml.load(stream=file, Loader=yaml.FullLoader) or {}
-                except yaml.YAMLError as error:
-                    LOGGER.error(error)
-                else:
-                    for epoch, device_info in blocked_devices.items():
-                        yield device_info.get('mac')
+        # noinspection PyProtectedMember
+        get_ledger().add(device_info=device._asdict())
 
     def always_allow(self, device: Device or str) -> NoReturn:
         """Allows internet access to a device.
 
         Saves the device name to ``snapshot.json`` to not block in the future.
-        Removes the device name from ``blocked.json`` if an entry is present.
+        Removes the device from the block ledger if an entry is present.
 
         Args:
             device: Takes device name or Device object as an argument
@@ -146,70 +252,107 @@ class LocalIPScan:
         if not (device := self.allow(device=device)):  # converts string to Device object
             return
 
-        with open(config.snapshot, 'r+') as file:
-            data = json.load(file)
-            file.seek(0)
-            if device.ip and device.ip in list(data.keys()):
-                LOGGER.info("'%s' is a part of allow list." % device.name)
-                data[device.ip][-1] = DeviceStatus.allow
-                LOGGER.info("Setting status to Allow for '%s' in %s" % (device.name, config.snapshot))
-            elif device.ip:
-                data[device.ip] = [device.name, device.type, device.allow_or_block]
-                LOGGER.info("Adding '%s' to %s" % (device.name, config.snapshot))
-            json.dump(data, file, indent=2)
-            file.truncate()
-
-        if os.path.isfile(config.blocked):
-            with open(config.blocked) as file:
-                try:
-                    blocked_devices = yaml.load(stream=file, Loader=yaml.FullLoader) or {}
-                except yaml.YAMLError as error:
-                    LOGGER.error(error)
-                    return
-            blocked_copy = copy.deepcopy(blocked_devices)
-            for epoch, device_info in blocked_copy.items():  # convert to a list of dict
-                if device_info.get('mac') == device.mac:
-                    LOGGER.info("Removing '%s' from %s" % (device.name, config.blocked))
-                    del blocked_devices[epoch]
-            file.seek(0)
-            file.truncate()
-            if blocked_devices:
-                yaml.dump(blocked_devices, file, indent=2)
-
-    def run(self, block: bool = False) -> NoReturn:
+        store = get_store()
+        if store.inventory().match(Record(mac=device.mac, ip=device.ip)):
+            LOGGER.info("'%s' is a part of allow list." % device.name)
+            LOGGER.info("Setting status to Allow for '%s' in %s" % (device.name, config.snapshot))
+        else:
+            LOGGER.info("Adding '%s' to %s" % (device.name, config.snapshot))
+        store.put(record=Record(mac=device.mac, ip=device.ip, name=device.name, type=device.type,
+                                status=DeviceStatus.allow.value))
+
+        if get_ledger().remove(mac=device.mac):
+            LOGGER.info("Removing '%s' from %s" % (device.name, config.blocked))
+        get_alert_state().forget(mac=device.mac)
+
+    @staticmethod
+    def to_record(device: Device) -> Record:
+        """Converts a Device object into a Record.
+
+        Args:
+            device: Takes Device object as an argument.
+
+        Returns:
+            Record:
+            Returns a Record object.
+        """
+        return Record(mac=device.mac, ip=device.ip, name=device.name, type=device.type,
+                      status=device.allow_or_block, device=device)
+
+    @staticmethod
+    def sample(record: Record) -> Sample:
+        """Extracts the telemetry of a device, from the Record object of a scan.
+
+        Args:
+            record: Takes the Record object of the device as an argument.
+
+        Returns:
+            Sample:
+            Returns the signal strength and link rate, and the access point, SSID and type as the location.
+        """
+        device = record.device
+        location = " / ".join(str(value) for value in (device.conn_ap_mac, device.ssid, device.type) if value)
+        return Sample(mac=record.mac, signal=to_number(device.signal), rate=to_number(device.link_rate),
+                      location=location or None)
+
+    @staticmethod
+    def intruder(device: Device) -> Optional[Dict[str, str]]:
+        """Logs a device that is not present in the snapshot.
+
+        Args:
+            device: Takes Device object as an argument.
+
+        Returns:
+            Dict[str, str]:
+            Returns the device information to be notified, if the device has internet access.
+        """
+        LOGGER.warning("{name} with MAC address {mac} and a signal strength of {signal}% has connected to your "
+                       "network.".format(name=device.name, mac=device.mac, signal=device.signal))
+
+        if device.allow_or_block == DeviceStatus.allow:
+            return dict(Name=device.name, IP=device.ip, MAC=device.mac, **vendor_info(mac=device.mac))
+        LOGGER.info("'%s' does not have internet access." % device.name)
+
+    def block_intruders(self, devices: List[Device], ledger: BlockLedger) -> NoReturn:
+        """Blocks the devices in a single configuration session, and stores them in the block ledger.
+
+        Args:
+            devices: Takes a list of Device objects as an argument.
+            ledger: Block ledger to store the blocked devices.
+        """
+        if not devices:
+            return
+        results = self.block_many(devices=devices)
+        for device in devices:
+            if not results.get(device.mac):
+                continue
+            if device.mac not in ledger:
+                self._dump_blocked(device=device)
+            else:
+                LOGGER.info("'%s' is a part of deny list." % device.name)
+
+    def _block_records(self, records: List[Record]) -> NoReturn:
+        """Blocks the intruders found in a scan, and stores them in the block ledger.
+
+        Args:
+            records: Takes a list of Record objects of the intruders as an argument.
+        """
+        self.block_intruders(devices=[record.device for record in records], ledger=get_ledger())
+
+    @timed("scan", backend="netgear")
+    def run(self, block: bool = False) -> List[Device]:
         """Trigger to initiate a Network Scan and block the devices that are not present in ``snapshot.json`` file.
 
         Args:
             block: Blocks internet access to the device. _only for netgear routers_
+
+        Returns:
+            List[Device]:
+            Returns the list of devices that were connected during the scan.
         """
-        if not os.path.isfile(config.snapshot):
-            LOGGER.error("'%s' not found. Please pass `init=True` to generate "
-                         "snapshot and review it." % config.snapshot)
-            raise FileNotFoundError(
-                '%s is required' % config.snapshot
-            )
-        with open(config.snapshot) as file:
-            device_list = json.load(file)
-        stored_ips = list(device_list.keys())
-        threat = []
-        blocked = list(self._get_blocked())
-        for device in self._get_devices():
-            if device.ip and device.ip not in stored_ips:
-                LOGGER.warning("{name} with MAC address {mac} and a signal strength of {signal}% has connected to your "
-                               "network.".format(name=device.name, mac=device.mac, signal=device.signal))
-
-                if device.allow_or_block == DeviceStatus.allow:
-                    if block:
-                        self.block(device=device)
-                        if device.mac not in blocked:
-                            self._dump_blocked(device=device)
-                        else:
-                            LOGGER.info("'%s' is a part of deny list." % device.name)
-                    threat.append(dict(Name=device.name, IP=device.ip, MAC=device.mac))
-                else:
-                    LOGGER.info("'%s' does not have internet access." % device.name)
-
-        if threat:
-            notify(msg_dict=threat)
-        else:
-            LOGGER.info('NetSec has completed. No threats found on your network.')
+        devices = self._get_devices(fresh=True)
+        process_scan(current=Inventory(self.to_record(device=device)
+                                       for device in devices if device.ip),  # Only look for currently connected devices
+                     backend="netgear", intruder=lambda record: self.intruder(device=record.device),
+                     sample=self.sample, block=self._block_records if block else None)
+        return devices
@@ -0,0 +1,196 @@
+import argparse
+import csv
+import mmap
+import struct
+from typing import Dict, Iterable, List, NoReturn, Optional, Tuple
+
+from netsec.modules.settings import LOGGER, config
+from netsec.modules.state import atomic_write
+
+_MAGIC = b"NSOUI\x00\x01\x00"
+_HEADER = struct.Struct("<8s3I")  # magic, number of MA-S, MA-M and MA-L entries
+_ENTRY = struct.Struct("<QI")  # prefix, offset of the vendor name in the string table
+_LENGTH = struct.Struct("<H")
+_REGISTRIES = {"MA-S": 36, "MA-M": 28, "MA-L": 24}  # most specific first
+_BITS = tuple(_REGISTRIES.values())
+
+
+def _to_int(mac: str) -> Optional[int]:
+    """Converts a MAC address into a 48-bit integer, or ``None`` if it is malformed."""
+    digits = mac.replace(":", "").replace("-", "").replace(".", "")
+    if len(digits) != 12:
+        return
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return
+
+
+def is_randomized(mac: str) -> bool:
+    """Checks if a MAC address is locally administered, like the private addresses used by phones and laptops.
+
+    Args:
+        mac: MAC address of the device.
+
+    Returns:
+        bool:
+        Returns a boolean flag to indicate whether the address is randomized, rather than assigned by the vendor.
+    """
+    value = _to_int(mac) if mac else None
+    return value is not None and bool(value >> 40 & 0x02) and not value >> 40 & 0x01
+
+
+def build(sources: Iterable[str], output: str) -> int:
+    """Builds the vendor index from the IEEE registry CSV files.
+
+    Args:
+        sources: Paths of the ``oui.csv`` (MA-L), ``mam.csv`` (MA-M) and ``oui36.csv`` (MA-S) files.
+        output: Path of the index file.
+
+    Returns:
+        int:
+        Returns the number of prefixes in the index.
+    """
+    sections: Dict[int, Dict[int, str]] = {bits: {} for bits in _BITS}
+    for source in sources:
+        with open(source, newline='', encoding='utf-8') as file:
+            for row in csv.reader(file):
+                if len(row) < 3 or row[0].strip() not in _REGISTRIES:  # header
+                    continue
+                assignment = row[1].strip()
+                bits = _REGISTRIES[row[0].strip()]
+                if len(assignment) * 4 != bits:
+                    LOGGER.warning("Skipping malformed assignment %r in %s" % (assignment, source))
+                    continue
+                sections[bits][int(assignment, 16)] = row[2].strip()
+    strings, offsets = bytearray(), {}
+    for vendor in sorted({vendor for section in sections.values() for vendor in section.values()}):
+        encoded = vendor.encode()[:65_535]
+        offsets[vendor] = len(strings)
+        strings += _LENGTH.pack(len(encoded)) + encoded
+    data = bytearray(_HEADER.pack(_MAGIC, *(len(sections[bits]) for bits in _BITS)))
+    for bits in _BITS:
+        for prefix in sorted(sections[bits]):
+            data += _ENTRY.pack(prefix, offsets[sections[bits][prefix]])
+    atomic_write(filepath=output, data=bytes(data + strings))
+    return sum(len(section) for section in sections.values())
+
+
+class VendorIndex:
+    """Vendor lookup by MAC address, over a sorted binary index that is memory mapped upon first lookup.
+
+    >>> VendorIndex
+
+    See Also:
+        - Prefixes are matched from the most specific registry (MA-S, 36 bits) to the least (MA-L, 24 bits).
+        - Each lookup is a binary search on the mapped file, so only the pages touched are read into memory.
+        - Build the index with ``python -m netsec.modules.oui oui.csv mam.csv oui36.csv``
+    """
+
+    def __init__(self, filepath: str = None):
+        """Instantiates the index, without opening the file.
+
+        Args:
+            filepath: Path of the index file. Defaults to ``config.oui_index``
+        """
+        self.filepath = filepath or config.oui_index
+        self._map: Optional[mmap.mmap] = None
+        self._sections: List[Tuple[int, int, int]] = []
+        self._strings = 0
+        self._missing = False
+
+    def _open(self) -> bool:
+        """Maps the index file into memory, and reads the location of each section."""
+        if self._map is not None:
+            return True
+        if self._missing:
+            return False
+        try:
+            with open(self.filepath, 'rb') as file:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):  # mapping an empty file raises ValueError
+            LOGGER.warning("OUI index not found at '%s', vendors will not be resolved." % self.filepath)
+            self._missing = True
+            return False
+        magic, *counts = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            LOGGER.error("'%s' is not an OUI index." % self.filepath)
+            self.close()
+            self._missing = True
+            return False
+        offset = _HEADER.size
+        for bits, count in zip(_BITS, counts):
+            self._sections.append((bits, offset, count))
+            offset += count * _ENTRY.size
+        self._strings = offset
+        return True
+
+    def lookup(self, mac: str) -> Optional[str]:
+        """Looks up the vendor of a device.
+
+        Args:
+            mac: MAC address of the device.
+
+        Returns:
+            str:
+            Returns the name of the vendor, or ``None`` if the prefix is not registered.
+        """
+        if not mac or (value := _to_int(mac)) is None or not self._open():
+            return
+        for bits, offset, count in self._sections:
+            prefix = value >> (48 - bits)
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                found, string = _ENTRY.unpack_from(self._map, offset + middle * _ENTRY.size)
+                if found < prefix:
+                    low = middle + 1
+                elif found > prefix:
+                    high = middle
+                else:
+                    position = self._strings + string
+                    length, = _LENGTH.unpack_from(self._map, position)
+                    return self._map[position + _LENGTH.size:position + _LENGTH.size + length].decode()
+
+    def __len__(self) -> int:
+        """Number of prefixes in the index."""
+        return sum(count for _, _, count in self._sections) if self._open() else 0
+
+    def close(self) -> NoReturn:
+        """Unmaps the index file."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._sections = []
+
+
+_INDEXES: Dict[str, VendorIndex] = {}
+
+
+def get_index() -> VendorIndex:
+    """Returns the vendor index for the current ``config.oui_index``, which is mapped once per process."""
+    if config.oui_index not in _INDEXES:
+        _INDEXES[config.oui_index] = VendorIndex()
+    return _INDEXES[config.oui_index]
+
+
+def vendor_info(mac: str) -> Dict[str, str]:
+    """Describes the vendor of a device, to be included in the notifications.
+
+    Args:
+        mac: MAC address of the device.
+
+    Returns:
+        Dict[str, str]:
+        Returns the vendor and whether the MAC address is randomized.
+    """
+    return dict(Vendor=get_index().lookup(mac) or "Unknown", Randomized="Yes" if is_randomized(mac) else "No")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="python -m netsec.modules.oui",
+                                     description="Builds the OUI vendor index from the IEEE registry CSV files.")
+    parser.add_argument("sources", nargs="+", help="Paths of oui.csv, mam.csv and/or oui36.csv")
+    parser.add_argument("--output", default=config.oui_index, help="Path of the index file.")
+    args = parser.parse_args()
+    LOGGER.info("Indexed %d prefixes into %s" % (build(sources=args.sources, output=args.output), args.output))
@@ -0,0 +1,292 @@
+import os
+import re
+import select
+import socket
+import struct
+from typing import Dict, Iterable, List, NamedTuple, NoReturn, Optional, Tuple
+
+from netsec.modules.arp import ARP_TABLE, read_arp_table
+from netsec.modules.helper import notify
+from netsec.modules.inventory import Record
+from netsec.modules.metrics import get_metrics
+from netsec.modules.oui import vendor_info
+from netsec.modules.settings import LOGGER
+from netsec.modules.snapshot import get_baseline
+from netsec.modules.state import file_stamp
+
+# rtnetlink constants from linux/rtnetlink.h and linux/neighbour.h
+_RTMGRP_NEIGH = 0x4
+_RTM_NEWNEIGH = 28
+_NDA_DST = 1
+_NDA_LLADDR = 2
+_NUD_VALID = 0x02 | 0x04 | 0x08 | 0x10 | 0x40 | 0x80  # reachable, stale, delay, probe, noarp, permanent
+_NLMSGHDR = struct.Struct("=IHHII")
+_NDMSG = struct.Struct("=BBHiHBB")
+_RTATTR = struct.Struct("=HH")
+
+_ISC_LEASE = re.compile(r"lease\s+([\d.]+)\s*\{(.*?)\}", re.DOTALL)
+_ISC_MAC = re.compile(r"hardware\s+ethernet\s+([0-9a-fA-F:]+)\s*;")
+_ISC_NAME = re.compile(r'client-hostname\s+"([^"]*)"\s*;')
+_ISC_STATE = re.compile(r"binding\s+state\s+(\w+)\s*;")
+
+
+class Observation(NamedTuple):
+    """Device observed on the network by one of the passive sources.
+
+    >>> Observation
+
+    """
+
+    mac: str
+    ip: str
+    name: Optional[str]
+    source: str
+
+
+def parse_leases(text: str, source: str = "dhcp") -> Dict[str, Observation]:
+    """Parses the leases from a dnsmasq or an ISC DHCP lease file.
+
+    Args:
+        text: Contents of the lease file.
+        source: Name of the source, to be included in the observations.
+
+    Returns:
+        Dict[str, Observation]:
+        Returns the latest active lease per MAC address.
+    """
+    leases = {}
+    if _ISC_LEASE.search(text):
+        for ip, body in _ISC_LEASE.findall(text):
+            if not (mac := _ISC_MAC.search(body)):
+                continue
+            if (state := _ISC_STATE.search(body)) and state.group(1) != "active":
+                leases.pop(mac.group(1).upper(), None)
+                continue
+            name = _ISC_NAME.search(body)
+            leases[mac.group(1).upper()] = Observation(mac=mac.group(1).upper(), ip=ip,
+                                                       name=name.group(1) if name else None, source=source)
+        return leases
+    for line in text.splitlines():  # dnsmasq: <expiry> <mac> <ip> <hostname> <client id>
+        if len(columns := line.split()) < 4 or ":" not in columns[1]:
+            continue
+        leases[columns[1].upper()] = Observation(mac=columns[1].upper(), ip=columns[2],
+                                                 name=None if columns[3] == "*" else columns[3], source=source)
+    return leases
+
+
+class FileWatcher:
+    """Watches a lease file or the ARP table, and reports the devices that are new or changed since the last poll.
+
+    >>> FileWatcher
+
+    """
+
+    def __init__(self, filepath: str, arp: bool = False):
+        """Instantiates the watcher, without reading the file.
+
+        Args:
+            filepath: Path of the lease file or the ARP table.
+            arp: Reads the file as an ARP table, instead of a lease file.
+        """
+        self.filepath = filepath
+        self.arp = arp
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._seen: Dict[str, Tuple[str, Optional[str]]] = {}
+
+    def _read(self) -> Dict[str, Observation]:
+        """Reads the devices from the file."""
+        if self.arp:
+            return {neighbor.mac: Observation(mac=neighbor.mac, ip=neighbor.ip, name=None, source="arp")
+                    for neighbor in read_arp_table(filepath=self.filepath)}
+        with open(self.filepath) as file:
+            return parse_leases(text=file.read(), source=os.path.basename(self.filepath))
+
+    def poll(self) -> List[Observation]:
+        """Reads the file if it has changed since the last poll.
+
+        The ARP table is a virtual file whose modified time does not change, so it is read on every poll.
+
+        Returns:
+            List[Observation]:
+            Returns the devices that are new, or have a different IP address or name.
+        """
+        if not self.arp:
+            if (stamp := file_stamp(self.filepath)) is None:  # lease file is yet to be created
+                return []
+            if stamp == self._stamp:
+                return []
+            self._stamp = stamp
+        observations = []
+        for mac, observation in self._read().items():
+            if self._seen.get(mac) != (observation.ip, observation.name):
+                self._seen[mac] = (observation.ip, observation.name)
+                observations.append(observation)
+        return observations
+
+
+class NeighborListener:
+    """Listens to the neighbor updates from the kernel over netlink, which are sent as soon as a host is resolved.
+
+    >>> NeighborListener
+
+    """
+
+    def __init__(self):
+        """Subscribes to the neighbor updates. Raises ``OSError`` where netlink is not available."""
+        self.socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, 0)  # NETLINK_ROUTE
+        self.socket.bind((0, _RTMGRP_NEIGH))
+        self.socket.setblocking(False)
+        self._seen: Dict[str, str] = {}
+
+    def fileno(self) -> int:
+        """File descriptor of the socket, to wait on with ``select``."""
+        return self.socket.fileno()
+
+    def read(self) -> List[Observation]:
+        """Reads the pending neighbor updates.
+
+        Returns:
+            List[Observation]:
+            Returns the IPv4 neighbors that were resolved to a MAC address, that is new or has a different IP address.
+        """
+        observations = []
+        while True:
+            try:
+                data = self.socket.recv(65_536)
+            except BlockingIOError:
+                return observations
+            for observation in self.parse(data=data):
+                if self._seen.get(observation.mac) != observation.ip:
+                    self._seen[observation.mac] = observation.ip
+                    observations.append(observation)
+
+    @staticmethod
+    def parse(data: bytes) -> List[Observation]:
+        """Parses the ``RTM_NEWNEIGH`` messages from a netlink datagram."""
+        observations = []
+        offset = 0
+        while offset + _NLMSGHDR.size <= len(data):
+            length, kind, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+            if length < _NLMSGHDR.size:
+                break
+            if kind == _RTM_NEWNEIGH:
+                family, _, _, _, state, _, _ = _NDMSG.unpack_from(data, offset + _NLMSGHDR.size)
+                attributes, position = {}, offset + _NLMSGHDR.size + _NDMSG.size
+                while position + _RTATTR.size <= offset + length:
+                    size, attribute = _RTATTR.unpack_from(data, position)
+                    if size < _RTATTR.size:
+                        break
+                    attributes[attribute] = data[position + _RTATTR.size:position + size]
+                    position += (size + 3) & ~3
+                ip, mac = attributes.get(_NDA_DST), attributes.get(_NDA_LLADDR)
+                if family == socket.AF_INET and state & _NUD_VALID and ip and mac and len(mac) == 6:
+                    observations.append(Observation(mac=":".join("%02X" % octet for octet in mac),
+                                                    ip=socket.inet_ntoa(ip), name=None, source="netlink"))
+            offset += (length + 3) & ~3
+        return observations
+
+    def close(self) -> NoReturn:
+        """Closes the socket."""
+        self.socket.close()
+
+
+class PassiveMonitor:
+    """Detects devices as they join the network from local signals, without polling the router.
+
+    >>> PassiveMonitor
+
+    See Also:
+        - Neighbor updates from netlink wake up the monitor as soon as the kernel resolves a host.
+        - Lease files from dnsmasq or ISC DHCP are checked for changes every ``interval`` seconds.
+        - The ARP table is read every ``interval`` seconds, only when netlink is not available.
+        - Every new or changed device is looked up in the snapshot, and notified if it is not present.
+    """
+
+    def __init__(self, lease_files: Iterable[str] = (), neighbors: bool = True,
+                 interval: float = 1, arp_table: str = ARP_TABLE):
+        """Instantiates the sources.
+
+        Args:
+            lease_files: Paths of the DHCP lease files to watch.
+            neighbors: Watches the neighbor updates from the kernel, or the ARP table where netlink is not available.
+            interval: Number of seconds between two polls of the files.
+            arp_table: Path of the ARP table.
+        """
+        self.interval = interval
+        self.arp_table = arp_table
+        self.watchers = [FileWatcher(filepath=filepath) for filepath in lease_files]
+        self.listener: Optional[NeighborListener] = None
+        if neighbors:
+            try:
+                self.listener = NeighborListener()
+            except (OSError, AttributeError) as error:  # AF_NETLINK is not defined outside Linux
+                LOGGER.warning("Netlink is not available, falling back to %s: %s" % (arp_table, error))
+                self.watchers.append(FileWatcher(filepath=arp_table, arp=True))
+        if not self.watchers and not self.listener:
+            raise ValueError(
+                "\n\natleast one lease file or neighbors is required"
+            )
+
+    @staticmethod
+    def check(observations: List[Observation]) -> List[Dict[str, str]]:
+        """Looks up the observed devices in the snapshot, and notifies the ones that are not present.
+
+        Args:
+            observations: Devices observed by the sources.
+
+        Returns:
+            List[Dict[str, str]]:
+            Returns the threats that were found.
+        """
+        if not observations:
+            return []
+        baseline = get_baseline()
+        threats = []
+        for observation in observations:
+            if baseline.match(Record(mac=observation.mac, ip=observation.ip)):
+                continue
+            LOGGER.warning("%s [%s: %s] is connected to your network, observed by %s." %
+                           (observation.name, observation.ip, observation.mac, observation.source))
+            threats.append(dict(Name=observation.name, MAC=observation.mac, IP=observation.ip,
+                                **vendor_info(mac=observation.mac)))
+        get_metrics().count("threats", len(threats), backend="passive")
+        if threats:
+            notify(msg_dict=threats)
+        return threats
+
+    def poll(self, timeout: float = None) -> List[Dict[str, str]]:
+        """Waits for neighbor updates upto the timeout, and then polls the files.
+
+        Args:
+            timeout: Number of seconds to wait for neighbor updates. Defaults to ``interval``
+
+        Returns:
+            List[Dict[str, str]]:
+            Returns the threats that were found.
+        """
+        timeout = self.interval if timeout is None else timeout
+        observations = []
+        if self.listener:
+            if select.select([self.listener], [], [], timeout)[0]:
+                observations.extend(self.listener.read())
+        elif timeout:
+            select.select([], [], [], timeout)
+        for watcher in self.watchers:
+            try:
+                observations.extend(watcher.poll())
+            except (OSError, ValueError) as error:
+                LOGGER.error("Failed to read %s: %s" % (watcher.filepath, error))
+        return self.check(observations=observations)
+
+    def run(self) -> NoReturn:
+        """Checks the devices that are present already, and then the devices as they are observed."""
+        if self.listener and os.path.isfile(self.arp_table):  # netlink only reports the updates
+            self.check(observations=FileWatcher(filepath=self.arp_table, arp=True).poll())
+        self.poll(timeout=0)
+        while True:
+            self.poll()
+
+    def close(self) -> NoReturn:
+        """Stops listening to neighbor updates."""
+        if self.listener:
+            self.listener.close()
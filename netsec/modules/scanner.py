@@ -0,0 +1,160 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, NoReturn, Optional, Sequence, Tuple
+
+from netsec.modules import arp, att
+from netsec.modules.helper import process_scan
+from netsec.modules.inventory import Inventory, Record
+from netsec.modules.ledger import get_ledger
+from netsec.modules.metrics import get_metrics, timed
+from netsec.modules.models import SupportedModules, Target
+from netsec.modules.netgear import LocalIPScan
+from netsec.modules.settings import LOGGER, config
+from netsec.modules.snapshot import get_store
+from netsec.modules.telemetry import Sample
+
+
+class MultiScan:
+    """Scans multiple routers concurrently, and merges the results into a single view of devices.
+
+    >>> MultiScan
+
+    """
+
+    def __init__(self, targets: Sequence[Target], max_workers: int = None):
+        """Validates the targets and creates a thread pool to scan them.
+
+        Args:
+            targets: Routers to be scanned.
+            max_workers: Maximum number of routers to scan at once. Defaults to the number of targets.
+        """
+        if not targets:
+            raise ValueError("\n\natleast one target is required")
+        for target in targets:
+            if target.module == SupportedModules.netgear and not (target.password or config.router_pass):
+                raise ValueError(
+                    "\n\n'router_pass' is required for NetGear routers"
+                )
+            elif target.module not in tuple(SupportedModules):
+                raise ValueError(
+                    "\n\nmodule should be one of %s" % ", ".join("'%s'" % supported.value
+                                                                 for supported in SupportedModules)
+                )
+        self.targets = list(targets)
+        self._sessions: Dict[Target, LocalIPScan] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or len(self.targets),
+                                            thread_name_prefix="netsec-scan")
+
+    def scan_target(self, target: Target) -> List[Record]:
+        """Scans a single router, re-using the router session from previous scans.
+
+        Args:
+            target: Router to be scanned.
+
+        Returns:
+            List[Record]:
+            Returns the devices connected to the router, as Record objects.
+        """
+        if target.module == SupportedModules.netgear:
+            if target not in self._sessions:
+                self._sessions[target] = LocalIPScan(host=target.host, password=target.password)
+            return [LocalIPScan.to_record(device=device)
+                    for device in self._sessions[target]._get_devices(fresh=True) if device.ip]
+        if target.module == SupportedModules.arp:
+            return [arp.to_record(device=device) for device in arp.get_attached_devices(network_id=target.host)]
+        source = "http://%s/cgi-bin/devices.ha" % target.host if target.host else None
+        return [att.to_record(device=device)
+                for device in att.get_attached_devices(source=source, timeout=target.timeout) if device.ipv4_address]
+
+    def scan(self) -> Tuple[Inventory, Dict[str, Target]]:
+        """Scans all the routers concurrently, waiting on each router only until its timeout.
+
+        Devices that are connected to more than one router (like mesh access points) are listed once.
+        Raises ``ConnectionError`` when none of the routers could be scanned, so that the scan is skipped instead of
+        treating every device as disconnected.
+
+        Returns:
+            Tuple[Inventory, Dict[str, Target]]:
+            Returns the merged inventory, and the router each device was found on, keyed by MAC address.
+        """
+        start = time.monotonic()
+        futures = {target: self._executor.submit(self.scan_target, target) for target in self.targets}
+        records, sources, failures = [], {}, 0
+        for target, future in futures.items():
+            try:
+                result = future.result(timeout=max(start + target.timeout - time.monotonic(), 0))
+            except FutureTimeoutError:
+                future.cancel()
+                LOGGER.error("Scanning %s router at '%s' timed out after %ss" %
+                             (target.module.value, target.host or 'default', target.timeout))
+                get_metrics().count("router_failures", backend=target.module.name, reason="timeout")
+                failures += 1
+                continue
+            except (ConnectionError, ValueError) as error:
+                LOGGER.error("Failed to scan %s router at '%s': %s" % (target.module.value,
+                                                                       target.host or 'default', error))
+                get_metrics().count("router_failures", backend=target.module.name, reason="error")
+                failures += 1
+                continue
+            for record in result:
+                if (key := record.mac or record.ip) not in sources:
+                    sources[key] = target
+                    records.append(record)
+        if failures == len(self.targets):
+            raise ConnectionError("Failed to scan all %d routers." % failures)
+        LOGGER.info("Scanned %d routers in %.2fs" % (len(self.targets), time.monotonic() - start))
+        return Inventory(records), sources
+
+    def create_snapshot(self) -> NoReturn:
+        """Creates a snapshot.json using the devices connected to all the routers."""
+        devices, _ = self.scan()
+        LOGGER.info('Number of devices connected: %d' % len(devices))
+        get_store().save(records=devices)
+
+    @timed("scan", backend="multi")
+    def run(self, block: bool = False) -> Inventory:
+        """Trigger to initiate a Network Scan on all routers and alert on devices that are not present in the snapshot.
+
+        Args:
+            block: Blocks internet access to the device. _only for netgear routers_
+
+        Returns:
+            Inventory:
+            Returns the merged inventory of devices that were connected during the scan.
+        """
+        current, sources = self.scan()
+
+        def intruder(record: Record) -> Optional[Dict[str, str]]:
+            """Logs an unknown device, as the backend of the router it was found on."""
+            target = sources[record.mac or record.ip]
+            if target.module == SupportedModules.netgear:
+                return LocalIPScan.intruder(device=record.device)
+            if target.module == SupportedModules.arp:
+                return arp.intruder(record=record)
+            return att.intruder(record=record)
+
+        def sample(record: Record) -> Optional[Sample]:
+            """Extracts the telemetry of a known device, as the backend of the router it was found on."""
+            target = sources[record.mac or record.ip]
+            if target.module == SupportedModules.netgear:
+                return LocalIPScan.sample(record=record)
+            if target.module == SupportedModules.att:
+                return att.sample(record=record)
+
+        def block_intruders(records: List[Record]) -> NoReturn:
+            """Blocks the intruders on the netgear routers they were found on."""
+            ledger, intruders = get_ledger(), {}
+            for record in records:
+                if (target := sources[record.mac or record.ip]).module == SupportedModules.netgear:
+                    intruders.setdefault(target, []).append(record.device)
+            for target, devices in intruders.items():
+                self._sessions[target].block_intruders(devices=devices, ledger=ledger)
+
+        process_scan(current=current, backend="multi", intruder=intruder, sample=sample,
+                     block=block_intruders if block else None)
+        return current
+
+    def shutdown(self) -> NoReturn:
+        """Shuts down the thread pool, without waiting on routers that have not responded."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,13 +1,6 @@
 import logging
 import os
-from typing import AnyStr
-
-import dotenv
-
-dotenv.load_dotenv(dotenv_path=".env")
-
-if not os.path.isdir('fileio'):
-    os.mkdir('fileio')
+from typing import AnyStr, NoReturn
 
 LOGGER = logging.getLogger(__name__)
 handler = logging.StreamHandler()
@@ -19,17 +12,56 @@ LOGGER.setLevel(level=logging.DEBUG)
 LOGGER.addHandler(hdlr=handler)
 
 
+def make_dirs(filepath: str) -> NoReturn:
+    """Creates the parent directory for a file, if it is not present already.
+
+    Args:
+        filepath: Path of the file.
+    """
+    if (directory := os.path.dirname(filepath)) and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+
+
 class Config:
-    """Wrapper for all the environment variables."""
+    """Wrapper for all the environment variables.
 
-    router_pass: AnyStr = os.environ.get('ROUTER_PASS') or os.environ.get('router_pass')
-    gmail_user: AnyStr = os.environ.get('GMAIL_USER') or os.environ.get('gmail_user')
-    gmail_pass: AnyStr = os.environ.get('GMAIL_PASS') or os.environ.get('gmail_pass')
-    recipient: AnyStr = os.environ.get('RECIPIENT') or os.environ.get('recipient')
-    phone: AnyStr = os.environ.get('PHONE') or os.environ.get('phone')
+    Environment variables are loaded from the ``.env`` file, upon the first access to any of them.
+    """
+
+    router_pass: AnyStr
+    gmail_user: AnyStr
+    gmail_pass: AnyStr
+    recipient: AnyStr
+    phone: AnyStr
     snapshot: os.PathLike = os.path.join('fileio', 'snapshot.json')
-    blocked: os.PathLike = os.path.join('fileio', 'blocked.yaml')
+    snapshot_journal: os.PathLike = os.path.join('fileio', 'snapshot.journal')
+    blocked: os.PathLike = os.path.join('fileio', 'blocked.db')
+    blocked_yaml: os.PathLike = os.path.join('fileio', 'blocked.yaml')
     notification: os.PathLike = os.path.join('fileio', 'last_notify')
+    notification_queue: os.PathLike = os.path.join('fileio', 'notifications.queue')
+    alert_state: os.PathLike = os.path.join('fileio', 'alerts.json')
+    last_scan: os.PathLike = os.path.join('fileio', 'last_scan.json')
+    history: os.PathLike = os.path.join('fileio', 'history')
+    oui_index: os.PathLike = os.path.join('fileio', 'oui.idx')
+    telemetry: os.PathLike = os.path.join('fileio', 'telemetry.npz')
+
+    _env_vars = ('router_pass', 'gmail_user', 'gmail_pass', 'recipient', 'phone')
+
+    def _load_env(self) -> NoReturn:
+        """Loads the ``.env`` file, and sets the environment variables that haven't been set on the object already."""
+        import dotenv
+
+        dotenv.load_dotenv(dotenv_path=".env")
+        for key in self._env_vars:
+            if key not in self.__dict__:
+                setattr(self, key, os.environ.get(key.upper()) or os.environ.get(key))
+
+    def __getattr__(self, item: str) -> AnyStr:
+        """Loads the environment variables when they are accessed for the first time."""
+        if item in self._env_vars:
+            self._load_env()
+            return self.__dict__[item]
+        raise AttributeError("%r object has no attribute %r" % (type(self).__name__, item))
 
 
 config = Config()
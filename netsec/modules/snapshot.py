@@ -0,0 +1,260 @@
+import json
+import os
+from typing import Dict, Iterable, List, NoReturn, Optional, Tuple, Union
+
+from netsec.modules.inventory import Inventory, Record
+from netsec.modules.settings import LOGGER, config, make_dirs
+from netsec.modules.state import atomic_write, file_lock, file_stamp
+
+_FIELDS = ("ip", "name", "type", "status")
+_GENERATION = "generation"
+
+
+def _from_entry(key: str, value: Union[Dict[str, Optional[str]], List[str]]) -> Record:
+    """Converts an entry from ``snapshot.json`` into a Record.
+
+    Args:
+        key: MAC address of the device, or the IP address for entries in the legacy format.
+        value: Device information as a dictionary, or a list of name, type and status for the legacy format.
+
+    Returns:
+        Record:
+        Returns a Record object.
+    """
+    if isinstance(value, list):  # legacy format keyed by IP address, without the MAC address
+        return Record(ip=key, name=value[0], type=value[1], status=value[-1])
+    return Record(mac=key, **{field: value.get(field) for field in _FIELDS})
+
+
+def _to_entry(record: Record) -> Tuple[str, Union[Dict[str, Optional[str]], List[str]]]:
+    """Converts a Record into an entry for ``snapshot.json``, keyed by MAC address when available."""
+    if record.mac:
+        return record.mac, {field: getattr(record, field) for field in _FIELDS}
+    return record.ip, [record.name, record.type, record.status]
+
+
+class Snapshot:
+    """Snapshot store keyed by MAC address, that persists changes as an append-only journal.
+
+    >>> Snapshot
+
+    See Also:
+        - ``snapshot.json`` holds the compacted allow list, one entry per line to remain reviewable.
+        - Entries without a MAC address are kept in the legacy format, keyed by IP address.
+        - Every change is appended to the journal, which is merged into ``snapshot.json`` once it
+          exceeds ``compact_after`` entries.
+        - ``snapshot.json`` holds a generation, which is incremented whenever it is replaced. Journal entries are
+          tagged with the generation they apply to, so that entries left behind by an interrupted compaction are
+          ignored instead of being replayed on top of the new snapshot.
+        - Reads hold a shared lock and writes hold an exclusive lock, so that processes sharing the
+          snapshot never see a partial write or lose each other's changes.
+    """
+
+    def __init__(self, filepath: str = None, journal: str = None, compact_after: int = 1_000):
+        """Instantiates the store.
+
+        Args:
+            filepath: Path of the snapshot file. Defaults to ``config.snapshot``
+            journal: Path of the journal file. Defaults to ``config.snapshot_journal``
+            compact_after: Number of journal entries after which the journal is compacted.
+        """
+        self.filepath = filepath or config.snapshot
+        self.journal = journal or config.snapshot_journal
+        self.compact_after = compact_after
+        self._entries: Dict[str, Record] = {}
+        self._journaled = 0
+        self._generation = 0
+        self._stamps: Optional[Tuple] = None
+        self._inventory: Optional[Inventory] = None
+        self._lock = file_lock(filepath=self.filepath)
+
+    def exists(self) -> bool:
+        """Checks if a snapshot has been created."""
+        return os.path.isfile(self.filepath) or os.path.isfile(self.journal)
+
+    @property
+    def stamps(self) -> Optional[Tuple]:
+        """Modified time and size of the snapshot and the journal, as of the last load or write."""
+        return self._stamps
+
+    def _load(self) -> NoReturn:
+        """Reads the snapshot and replays the journal, only when either of them was modified since the last load."""
+        with self._lock.hold(shared=True):
+            self._read()
+
+    def _read(self) -> NoReturn:
+        """Reads the snapshot and replays the journal, while holding the lock."""
+        stamps = (file_stamp(self.filepath), file_stamp(self.journal))
+        if stamps == self._stamps:
+            return
+        entries, generation = {}, 0
+        if stamps[0]:
+            with open(self.filepath) as file:
+                data = json.load(file)
+            generation = data.pop(_GENERATION, 0)
+            for key, value in data.items():
+                record = _from_entry(key=key, value=value)
+                entries[record.mac or record.ip] = record
+        journaled = 0
+        if stamps[1]:
+            with open(self.journal) as file:
+                for line in file:
+                    if not (line := line.strip()):
+                        continue
+                    try:
+                        key, value, *tag = json.loads(line)
+                    except ValueError:  # partially written entry
+                        LOGGER.warning("Skipping malformed entry in %s" % self.journal)
+                        continue
+                    if (tag[0] if tag else 0) != generation:  # left behind by an interrupted compaction
+                        continue
+                    if value is None:
+                        entries.pop(key, None)
+                    else:
+                        entries[key] = _from_entry(key=key, value=value)
+                    journaled += 1
+        self._entries, self._journaled, self._stamps, self._inventory = entries, journaled, stamps, None
+        self._generation = generation
+
+    def inventory(self) -> Inventory:
+        """Loads the snapshot as an Inventory object.
+
+        Returns:
+            Inventory:
+            Returns the stored allow list as an Inventory object.
+        """
+        self._load()
+        if self._inventory is None:
+            self._inventory = Inventory(self._entries.values())
+        return self._inventory
+
+    def _append(self, key: str, value: Union[Dict[str, Optional[str]], List[str], None]) -> NoReturn:
+        """Appends an entry to the journal and applies it to the in-memory state."""
+        with self._lock.hold():
+            self._load()
+            make_dirs(filepath=self.journal)
+            with open(self.journal, 'a') as file:
+                file.write(json.dumps([key, value, self._generation]) + "\n")
+            if value is None:
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = _from_entry(key=key, value=value)
+            self._journaled += 1
+            self._stamps, self._inventory = (self._stamps[0], file_stamp(self.journal)), None
+            if self._journaled >= self.compact_after:
+                self.compact()
+
+    def put(self, record: Record) -> NoReturn:
+        """Adds or updates a device in the snapshot.
+
+        Args:
+            record: Takes a Record object as an argument.
+        """
+        if not record.mac and not record.ip:
+            raise ValueError("\n\nrecord should have either a MAC address or an IP address")
+        with self._lock.hold():
+            self._load()
+            key, value = _to_entry(record=record)
+            if record.mac and record.ip:
+                # replace legacy entries for the same IP address, since the device is now keyed by MAC address
+                legacy = self._entries.get(record.ip)
+                if legacy and not legacy.mac:
+                    self._append(key=record.ip, value=None)
+            self._append(key=key, value=value)
+
+    def remove(self, key: str) -> NoReturn:
+        """Removes a device from the snapshot.
+
+        Args:
+            key: MAC address of the device, or the IP address for entries in the legacy format.
+        """
+        with self._lock.hold():
+            self._load()
+            key = key.upper() if key.upper() in self._entries else key
+            if key in self._entries:
+                self._append(key=key, value=None)
+
+    def _write(self) -> NoReturn:
+        """Replaces the snapshot file with the in-memory state as the next generation, and truncates the journal."""
+        with self._lock.hold():
+            generation = self._generation + 1
+            lines = ["  %s: %s" % (json.dumps(_GENERATION), json.dumps(generation))]
+            for record in self._entries.values():
+                key, value = _to_entry(record=record)
+                lines.append("  %s: %s" % (json.dumps(key), json.dumps(value)))
+            atomic_write(filepath=self.filepath, data="{\n" + ",\n".join(lines) + "\n}\n")
+            with open(self.journal, 'w'):
+                pass
+            self._journaled, self._generation, self._inventory = 0, generation, None
+            self._stamps = (file_stamp(self.filepath), file_stamp(self.journal))
+
+    def save(self, records: Iterable[Record]) -> NoReturn:
+        """Replaces the snapshot with the given records.
+
+        Args:
+            records: Takes an iterable of Record objects as an argument.
+        """
+        with self._lock.hold():
+            self._load()
+            self._entries = {}
+            for record in records:
+                key, value = _to_entry(record=record)
+                self._entries[key] = _from_entry(key=key, value=value)
+            self._write()
+
+    def compact(self) -> NoReturn:
+        """Merges the journal into the snapshot file."""
+        with self._lock.hold():
+            self._load()
+            LOGGER.debug("Compacting %d journal entries into %s" % (self._journaled, self.filepath))
+            self._write()
+
+    def import_json(self, filepath: str) -> NoReturn:
+        """Imports devices from a snapshot file in the legacy format, keyed by IP address.
+
+        Args:
+            filepath: Path of the file to import.
+        """
+        with open(filepath) as file:
+            data = json.load(file)
+        with self._lock.hold():
+            self._load()
+            for key, value in data.items():
+                record = _from_entry(key=key, value=value)
+                self._entries[record.mac or record.ip] = record
+            self._write()
+
+    def export_json(self, filepath: str) -> NoReturn:
+        """Exports the snapshot in the legacy format, keyed by IP address.
+
+        Args:
+            filepath: Path of the file to export to.
+        """
+        self._load()
+        data = {record.ip: [record.name, record.type, record.status] for record in self._entries.values() if record.ip}
+        atomic_write(filepath=filepath, data=json.dumps(data, indent=2))
+
+
+_STORES: Dict[str, Snapshot] = {}
+
+
+def get_store() -> Snapshot:
+    """Returns the snapshot store for the current ``config.snapshot``, which retains its state across scans."""
+    if config.snapshot not in _STORES:
+        _STORES[config.snapshot] = Snapshot()
+    return _STORES[config.snapshot]
+
+
+def get_baseline() -> Inventory:
+    """Loads the snapshot, re-reading it only when the files were modified since the last load.
+
+    Returns:
+        Inventory:
+        Returns the stored allow list as an Inventory object.
+    """
+    if not (store := get_store()).exists():
+        LOGGER.error("'%s' not found. Please pass `init=True` to generate snapshot and review it." % config.snapshot)
+        raise FileNotFoundError(
+            "'%s' is required" % config.snapshot
+        )
+    return store.inventory()
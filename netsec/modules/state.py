@@ -0,0 +1,137 @@
+import contextlib
+import os
+import tempfile
+import threading
+from collections.abc import Generator
+from typing import Dict, NoReturn, Optional, TextIO, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from netsec.modules.settings import make_dirs
+
+
+class FileLock:
+    """Advisory lock for a state file, that is shared by the threads and processes using the same file.
+
+    >>> FileLock
+
+    See Also:
+        - Locks are held on a separate ``.lock`` file, so that the state file can be replaced while it is locked.
+        - Re-entrant within a thread, so that a method holding the lock can call another that takes it again.
+        - Falls back to locking across threads only, where ``fcntl`` is not available.
+    """
+
+    def __init__(self, filepath: str):
+        """Instantiates the lock, without acquiring it.
+
+        Args:
+            filepath: Path of the state file to be locked.
+        """
+        self.filepath = filepath + ".lock"
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._shared = False
+        self._file: Optional[TextIO] = None
+
+    def acquire(self, shared: bool = False) -> NoReturn:
+        """Acquires the lock, waiting for other threads and processes to release it.
+
+        Args:
+            shared: Acquires a shared lock, which allows other processes to read at the same time.
+        """
+        self._lock.acquire()
+        if not self._depth:
+            make_dirs(filepath=self.filepath)
+            self._file = open(self.filepath, 'a')
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._shared = shared
+        elif self._shared and not shared:
+            if fcntl:  # upgrade, for a write nested within a read
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            self._shared = False
+        self._depth += 1
+
+    def release(self) -> NoReturn:
+        """Releases the lock, once the outermost holder in the thread is done with it."""
+        self._depth -= 1
+        if not self._depth:
+            self._file.close()  # closing the file releases the lock
+            self._file = None
+        self._lock.release()
+
+    @contextlib.contextmanager
+    def hold(self, shared: bool = False) -> Generator[None]:
+        """Holds the lock within the context.
+
+        Args:
+            shared: Acquires a shared lock, which allows other processes to read at the same time.
+        """
+        self.acquire(shared=shared)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+_LOCKS: Dict[str, FileLock] = {}
+_REGISTRY = threading.Lock()
+
+
+def file_lock(filepath: str) -> FileLock:
+    """Returns the lock for a state file, which is the same object for every caller in the process.
+
+    Args:
+        filepath: Path of the state file.
+
+    Returns:
+        FileLock:
+        Returns the FileLock object.
+    """
+    key = os.path.abspath(filepath)
+    with _REGISTRY:
+        if key not in _LOCKS:
+            _LOCKS[key] = FileLock(filepath=key)
+        return _LOCKS[key]
+
+
+def file_stamp(filepath: str) -> Optional[Tuple[int, int]]:
+    """Returns the modified time and size of a file, to detect changes made by other processes.
+
+    Args:
+        filepath: Path of the file.
+
+    Returns:
+        Tuple[int, int]:
+        Returns the modified time in nanoseconds and the size in bytes, or ``None`` if the file does not exist.
+    """
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return
+    return stat.st_mtime_ns, stat.st_size
+
+
+def atomic_write(filepath: str, data: Union[str, bytes]) -> NoReturn:
+    """Writes a file by replacing it with a fully written temporary file, so that readers never see a partial write.
+
+    Args:
+        filepath: Path of the file.
+        data: Contents of the file.
+    """
+    make_dirs(filepath=filepath)
+    descriptor, tmp = tempfile.mkstemp(dir=os.path.dirname(filepath) or ".",
+                                       prefix=os.path.basename(filepath) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, 'wb' if isinstance(data, bytes) else 'w') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, filepath)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
@@ -0,0 +1,311 @@
+import atexit
+import functools
+import io
+import os
+import re
+import time
+import zlib
+from typing import (TYPE_CHECKING, Any, Dict, Iterable, List, NamedTuple,
+                    NoReturn, Optional)
+
+from netsec.modules.inventory import Inventory, Record
+from netsec.modules.metrics import get_metrics
+from netsec.modules.oui import vendor_info
+from netsec.modules.settings import LOGGER, config
+from netsec.modules.state import atomic_write, file_lock
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?")
+_FLOOR = (5.0, 1.0)  # minimum deviation for signal (percent) and rate (Mbps), so that steady devices aren't noisy
+
+
+@functools.lru_cache(maxsize=4_096)
+def _code(location: Optional[str]) -> int:
+    """Converts a location into a non-zero code that is stable across processes, or 0 if it is missing."""
+    return zlib.crc32(location.encode()) + 1 if location else 0
+
+
+def to_number(value: Any) -> float:
+    """Converts a value like ``72``, ``"-61"`` or ``"866.7 Mbps"`` into a float, or NaN if it is missing."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if value and (match := _NUMBER.search(str(value))):
+        return float(match.group())
+    return float("nan")
+
+
+class Sample(NamedTuple):
+    """Telemetry of a device in a single scan.
+
+    >>> Sample
+
+    """
+
+    mac: str
+    signal: float
+    rate: float
+    location: Optional[str]
+
+
+class Anomaly(NamedTuple):
+    """Known device that moved to a different access point or band, with a signal or rate unlike its history.
+
+    >>> Anomaly
+
+    """
+
+    mac: str
+    score: float
+    before: Optional[str]
+    after: Optional[str]
+
+
+class Telemetry:
+    """Rolling window of signal and rate per device, held in preallocated ring buffers that are scored every scan.
+
+    >>> Telemetry
+
+    See Also:
+        - Holds the last ``window`` samples of atmost ``capacity`` devices, evicting the least recently seen ones.
+        - Scores every device at once, as the z-score of its signal and rate against its own window.
+          Sums over the window are updated as samples are added and dropped, so scoring does not re-read the window.
+        - Tracks the location (access point, band or mesh node) a device settles on, for ``min_samples`` scans.
+        - Flags a device that moves away from its location with a score of atleast ``threshold``,
+          which could be another device spoofing its MAC address.
+        - Changes are written to disk atmost once every ``save_interval`` seconds, and when the process exits.
+    """
+
+    def __init__(self, capacity: int = 4_096, window: int = 32, min_samples: int = 5, threshold: float = 3,
+                 filepath: str = None, save_interval: float = 300):
+        """Allocates the ring buffers, and loads the previous state from disk.
+
+        Args:
+            capacity: Maximum number of devices to track.
+            window: Number of samples retained per device.
+            min_samples: Minimum number of samples before a device is scored.
+            threshold: Minimum score for a device that moved, to be flagged.
+            filepath: Path of the state file. Defaults to ``config.telemetry``
+            save_interval: Minimum number of seconds between two writes of the state file by ``flush``
+        """
+        import numpy as np
+
+        self.capacity = capacity
+        self.window = window
+        self.min_samples = min_samples
+        self.threshold = threshold
+        self.filepath = filepath or config.telemetry
+        self.save_interval = save_interval
+        self._dirty = False
+        self._saved: Optional[float] = None
+        self._values = np.full((capacity, window, 2), np.nan, dtype=np.float32)
+        self._sums = np.zeros((capacity, 2), dtype=np.float64)
+        self._squares = np.zeros((capacity, 2), dtype=np.float64)
+        self._counts = np.zeros((capacity, 2), dtype=np.int32)
+        self._heads = np.zeros(capacity, dtype=np.int64)
+        self._anchors = np.zeros(capacity, dtype=np.int64)
+        self._stable = np.zeros(capacity, dtype=np.int32)
+        self._seen = np.zeros(capacity, dtype=np.float64)
+        self._locations: List[Optional[str]] = [None] * capacity
+        self._macs: List[Optional[str]] = [None] * capacity
+        self._slots: Dict[str, int] = {}
+        self._load()
+
+    def _load(self) -> NoReturn:
+        """Loads the ring buffers from disk, if they were saved with the same capacity and window."""
+        import numpy as np
+
+        if not os.path.isfile(self.filepath):
+            return
+        try:
+            with file_lock(filepath=self.filepath).hold(shared=True), np.load(self.filepath) as state:
+                if state["values"].shape != self._values.shape:
+                    LOGGER.info("Discarding %s, which was saved with a different capacity or window." %
+                                self.filepath)
+                    return
+                self._values[:] = state["values"]
+                self._heads[:] = state["heads"]
+                self._anchors[:] = state["anchors"]
+                self._stable[:] = state["stable"]
+                self._seen[:] = state["seen"]
+                macs, locations = state["macs"].tolist(), state["locations"].tolist()
+        except (OSError, KeyError, ValueError) as error:
+            LOGGER.error("Failed to load %s: %s" % (self.filepath, error))
+            return
+        valid = ~np.isnan(self._values)
+        values = np.where(valid, self._values, 0).astype(np.float64)
+        self._sums[:] = values.sum(axis=1)
+        self._squares[:] = (values * values).sum(axis=1)
+        self._counts[:] = valid.sum(axis=1)
+        self._macs = [mac or None for mac in macs]
+        self._slots = {mac: slot for slot, mac in enumerate(macs) if mac}
+        self._locations = [location or None for location in locations]
+
+    def save(self) -> NoReturn:
+        """Writes the ring buffers to disk."""
+        import numpy as np
+
+        buffer = io.BytesIO()
+        np.savez(buffer, values=self._values, heads=self._heads, anchors=self._anchors, stable=self._stable,
+                 seen=self._seen, macs=np.array([mac or "" for mac in self._macs]),
+                 locations=np.array([location or "" for location in self._locations]))
+        with file_lock(filepath=self.filepath).hold():
+            atomic_write(filepath=self.filepath, data=buffer.getvalue())
+        self._dirty, self._saved = False, time.monotonic()
+
+    def flush(self, force: bool = False) -> NoReturn:
+        """Writes the ring buffers to disk, if they have changed and were not written within ``save_interval`` seconds.
+
+        Args:
+            force: Writes the changes, regardless of when they were last written.
+        """
+        if self._dirty and (force or self._saved is None or time.monotonic() - self._saved >= self.save_interval):
+            self.save()
+
+    def _slot(self, mac: str, now: float) -> int:
+        """Returns the slot of a device, allocating one or evicting the least recently seen device if needed."""
+        if (slot := self._slots.get(mac)) is not None:
+            return slot
+        if len(self._slots) < self.capacity:
+            slot = len(self._slots)
+        else:
+            slot = int(self._seen.argmin())
+            del self._slots[self._macs[slot]]
+            self._values[slot] = float("nan")
+            self._sums[slot] = self._squares[slot] = self._counts[slot] = 0
+            self._heads[slot] = self._anchors[slot] = self._stable[slot] = 0
+            self._locations[slot] = None
+        self._slots[mac] = slot
+        self._macs[slot] = mac
+        self._seen[slot] = now  # so that it isn't evicted by the devices that follow in the same scan
+        return slot
+
+    def score(self, slots: "np.ndarray", values: "np.ndarray") -> "np.ndarray":
+        """Scores the samples against the window of each device.
+
+        Args:
+            slots: Slots of the devices.
+            values: Signal and rate of each device, as an array of shape ``(devices, 2)``
+
+        Returns:
+            np.ndarray:
+            Returns the largest z-score across signal and rate for each device, or 0 with fewer than ``min_samples``
+        """
+        import numpy as np
+
+        count, total = self._counts[slots], self._sums[slots]
+        mean = total / np.maximum(count, 1)
+        variance = (self._squares[slots] - total * mean) / np.maximum(count - 1, 1)
+        std = np.maximum(np.sqrt(np.maximum(variance, 0)), np.maximum(np.abs(mean) * 0.1, _FLOOR))
+        scores = np.abs(values - mean) / std
+        scores[(count < self.min_samples) | np.isnan(values)] = 0
+        return scores.max(axis=1)
+
+    def update(self, samples: Iterable[Sample], now: float = None) -> List[Anomaly]:
+        """Scores the samples of a scan, and adds them to the window of each device.
+
+        Args:
+            samples: Telemetry of the devices in the scan.
+            now: Time of the scan. Defaults to ``time.time()``
+
+        Returns:
+            List[Anomaly]:
+            Returns the devices that moved to a different location, with a score of atleast ``threshold``
+        """
+        import numpy as np
+
+        samples = list({sample.mac: sample for sample in samples if sample.mac}.values())
+        if not samples:
+            return []
+        now = now or time.time()
+        self._dirty = True
+        count = len(samples)
+        slots = np.fromiter((self._slot(sample.mac, now) for sample in samples), dtype=np.int64, count=count)
+        values = np.empty((count, 2), dtype=np.float32)
+        values[:, 0] = np.fromiter((sample.signal for sample in samples), dtype=np.float32, count=count)
+        values[:, 1] = np.fromiter((sample.rate for sample in samples), dtype=np.float32, count=count)
+        places = np.fromiter((_code(sample.location) for sample in samples), dtype=np.int64, count=count)
+        scores = self.score(slots=slots, values=values)
+
+        anchors, stable = self._anchors[slots], self._stable[slots]
+        settled = (places != 0) & (places == anchors)
+        moved = (places != 0) & (anchors != 0) & ~settled & (stable >= self.min_samples)
+        anomalies = [Anomaly(mac=samples[index].mac, score=float(scores[index]),
+                             before=self._locations[slots[index]], after=samples[index].location)
+                     for index in np.flatnonzero(moved & (scores >= self.threshold))]
+
+        columns = self._heads[slots] % self.window
+        for sign, sample in ((-1, self._values[slots, columns]), (1, values)):  # drop the oldest, add the newest
+            valid = ~np.isnan(sample)
+            sample = np.where(valid, sample, 0).astype(np.float64)
+            self._sums[slots] += sign * sample
+            self._squares[slots] += sign * sample * sample
+            self._counts[slots] += sign * valid
+        self._values[slots, columns] = values
+        self._heads[slots] += 1
+        self._seen[slots] = now
+        self._stable[slots] = np.where(settled, stable + 1, np.where(places != 0, 1, stable))
+        for index in np.flatnonzero((places != 0) & ~settled):
+            self._anchors[slots[index]] = places[index]
+            self._locations[slots[index]] = samples[index].location
+        return anomalies
+
+    def __len__(self) -> int:
+        """Number of devices tracked."""
+        return len(self._slots)
+
+
+def alert(anomaly: Anomaly, record: Record) -> Dict[str, str]:
+    """Logs an anomaly of a known device.
+
+    Args:
+        anomaly: Anomaly found by the Telemetry object.
+        record: Takes the Record object of the device as an argument.
+
+    Returns:
+        Dict[str, str]:
+        Returns the device information to be notified.
+    """
+    LOGGER.warning("%s [%s: %s] moved from %s to %s, with a signal or rate unlike its history (score %.1f)." %
+                   (record.name, record.ip, record.mac, anomaly.before, anomaly.after, anomaly.score))
+    return dict(Name=record.name, MAC=record.mac, IP=record.ip, **vendor_info(mac=record.mac),
+                Anomaly="Moved from %s to %s (score %.1f)" % (anomaly.before, anomaly.after, anomaly.score))
+
+
+_TELEMETRY: Dict[str, Telemetry] = {}
+
+
+def get_telemetry() -> Telemetry:
+    """Returns the telemetry for the current ``config.telemetry``, which is retained across scans."""
+    if config.telemetry not in _TELEMETRY:
+        _TELEMETRY[config.telemetry] = telemetry = Telemetry()
+        atexit.register(telemetry.flush, force=True)
+    return _TELEMETRY[config.telemetry]
+
+
+def flush_telemetry() -> NoReturn:
+    """Writes the changes to the telemetry in use, for processes that exit without running the atexit hooks."""
+    for telemetry in _TELEMETRY.values():
+        telemetry.flush(force=True)
+
+
+def score_devices(samples: Iterable[Sample], current: Inventory, backend: str) -> List[Dict[str, str]]:
+    """Scores the telemetry of the known devices in a scan, and retains it for the scans that follow.
+
+    Args:
+        samples: Telemetry of the known devices.
+        current: Devices found in the scan.
+        backend: Name of the backend, to label the metrics.
+
+    Returns:
+        List[Dict[str, str]]:
+        Returns the information to be notified, for each device that was flagged.
+    """
+    metrics = get_metrics()
+    with metrics.time("score", backend=backend):
+        telemetry = get_telemetry()
+        anomalies = telemetry.update(samples=samples)
+        telemetry.flush()
+    metrics.count("anomalies", len(anomalies), backend=backend)
+    return [alert(anomaly=anomaly, record=current.by_mac(anomaly.mac)) for anomaly in anomalies]